@@ -6,13 +6,21 @@ FT.com 每日中文摘要生成器
 """
 
 import requests
+import hashlib
 import json
 import os
+import sqlite3
+import codecs
+import unicodedata
+import xml.etree.ElementTree as ET
+from html.parser import HTMLParser
 from datetime import datetime, timedelta
-from bs4 import BeautifulSoup
 import re
 import time
 import random
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
 from dotenv import load_dotenv
 
 # 加载.env 文件
@@ -22,6 +30,38 @@ load_dotenv()
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 CONFIG_FILE = os.path.join(SCRIPT_DIR, ".env")
 OUTPUT_DIR = os.path.join(SCRIPT_DIR, "output")
+CACHE_DIR = os.path.join(SCRIPT_DIR, "cache")
+FEED_CACHE_FILE = os.path.join(CACHE_DIR, "feed-cache.json")
+
+# 翻译缓存：超过 TRANSLATION_MAX_AGE_DAYS 天的译文过期，条目超过 TRANSLATION_MAX_ENTRIES 时按最近使用淘汰
+TRANSLATION_DB = os.path.join(CACHE_DIR, "translations.sqlite")
+TRANSLATION_MAX_AGE_DAYS = 90
+TRANSLATION_MAX_ENTRIES = 20000
+
+# 离线关键词翻译词表（英文 → 中文，JSON 对象）
+GLOSSARY_FILE = os.path.join(SCRIPT_DIR, "glossary.json")
+
+# 文章分类词表（板块、关键词及权重）
+SECTIONS_FILE = os.path.join(SCRIPT_DIR, "sections.json")
+
+# 首页抓取：只提取 href 含这些路径的链接，锚文本不超过 HOMEPAGE_MIN_TITLE 个字符的忽略
+HOMEPAGE_URL = "https://www.ft.com/"
+HOMEPAGE_ARTICLE_PATHS = ("/content/", "/story/")
+HOMEPAGE_MIN_TITLE = 20
+
+# 近似重复文章合并：SimHash 指纹海明距离不超过该值视为同一篇；分段数需大于该距离（抽屉原理保证召回）
+# 实测短标题改动一个词、加前缀 "Live:" 或后缀 "— FT" 时距离多在 6-10，互不相关的标题最小约 17
+SIMHASH_MAX_DISTANCE = 10
+SIMHASH_BANDS = 11
+# 规范化 URL 时去掉的跟踪参数
+TRACKING_PARAMS = {"ftcamp", "segmentid", "fbclid", "gclid", "emailid", "sharetype", "accesstoken"}
+
+# 翻译流水线：并发数、同一服务两次请求的最小间隔（秒）、单次请求打包的最大字符数、整体截止时间（秒）
+# MyMemory 单次 q 参数上限 500 字节，多条短文本用换行拼接后一次翻译
+TRANSLATION_WORKERS = 4
+TRANSLATION_MIN_INTERVAL = {"mymemory": 0.5}
+TRANSLATION_BATCH_CHARS = 450
+TRANSLATION_DEADLINE = 25
 
 # FT.com 配置
 FT_USERNAME = os.getenv("FT_USERNAME", "")
@@ -29,6 +69,17 @@ FT_PASSWORD = os.getenv("FT_PASSWORD", "")
 FT_LOGIN_URL = "https://login.ft.com/auth/Realms/FT/collect?goto=success&gotoOnFail=failure&realm=FT&arg=new&locale=zh_CN"
 FT_API_URL = "https://www.ft.com/content/api/v1/search"
 
+# RSS 源（按顺序合并）；全部源并发请求，超过 RSS_DEADLINE 秒仍未返回的源直接跳过
+RSS_FEEDS = [
+    "https://www.ft.com/rss/home",
+    "https://www.ft.com/rss/world",
+    "https://www.ft.com/rss/companies",
+    "https://www.ft.com/rss/technology",
+    "https://www.ft.com/rss/markets",
+]
+RSS_DEADLINE = 12
+RSS_ITEMS_PER_FEED = 5
+
 # 邮件配置
 SMTP_HOST = os.getenv("SMTP_HOST", "smtp.163.com")
 SMTP_PORT = int(os.getenv("SMTP_PORT", "465"))
@@ -40,6 +91,399 @@ EMAIL_TO = os.getenv("EMAIL_TO", "david.li.zhiwei@gmail.com")
 DINGTALK_WEBHOOK = "https://oapi.dingtalk.com/robot/send?access_token=a28857b2fb6219f617702dda638035351329fd6dd4fdcc8ac875f4ff8fb698bf"
 
 
+class FeedCache:
+    """
+    RSS/首页的条件请求缓存
+
+    按 URL 保存 ETag、Last-Modified 和解析后的文章列表；再次请求时带上
+    If-None-Match / If-Modified-Since，服务端返回 304 就直接复用上次解析结果，
+    不再下载和解析页面
+    """
+
+    def __init__(self, path=FEED_CACHE_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def fetch(self, session, url, parse, timeout=10):
+        """
+        请求 url 并返回解析结果；parse(response) -> 文章列表
+        响应以流式读取，parse 可以只读取需要的部分，之后连接即被关闭
+        """
+        with self._lock:
+            cached = self.entries.get(url)
+        headers = {}
+        if cached:
+            if cached.get("etag"):
+                headers["If-None-Match"] = cached["etag"]
+            if cached.get("last_modified"):
+                headers["If-Modified-Since"] = cached["last_modified"]
+
+        response = session.get(url, timeout=timeout, headers=headers, stream=True)
+        try:
+            if response.status_code == 304 and cached:
+                print(f"未变化（304），使用缓存：{url}")
+                return cached["items"]
+            if response.status_code != 200:
+                return []
+            items = parse(response)
+        finally:
+            response.close()
+
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if items and (etag or last_modified):
+            with self._lock:
+                self.entries[url] = {
+                    "etag": etag,
+                    "last_modified": last_modified,
+                    "items": items,
+                    "fetched_at": datetime.now().isoformat(timespec="seconds"),
+                }
+        return items
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self._lock:
+            entries = dict(self.entries)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entries, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+class GlossaryTranslator:
+    """
+    离线词表翻译：启动时把词表编译成一个前缀树形式的正则，一遍扫描完成全部替换
+
+    - 同一位置优先匹配最长词条（"housing market" 优先于 "housing"）
+    - 词条两端按单词边界匹配，不区分大小写
+    - 前缀树正则在每个位置只沿共同前缀分支尝试，词表扩充到上千条时单次翻译开销基本不变
+    """
+
+    def __init__(self, glossary):
+        self.glossary = {}
+        for en, zh in glossary.items():
+            self.glossary.setdefault(en.lower(), zh)
+        self.pattern = None
+        if self.glossary:
+            trie = {}
+            for term in self.glossary:
+                node = trie
+                for char in term:
+                    node = node.setdefault(char, {})
+                node[""] = True
+            self.pattern = re.compile(r"\b" + self._trie_pattern(trie) + r"\b", re.IGNORECASE)
+
+    @classmethod
+    def from_file(cls, path=GLOSSARY_FILE):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return cls(json.load(f))
+        except (OSError, ValueError) as e:
+            print(f"读取翻译词表失败：{e}")
+            return cls({})
+
+    @classmethod
+    def _trie_pattern(cls, node):
+        """前缀树转正则：子分支在前、词尾可选，贪婪匹配即最长优先"""
+        branches = [re.escape(char) + cls._trie_pattern(child) for char, child in node.items() if char]
+        if not branches:
+            return ""
+        is_end = "" in node
+        if len(branches) == 1 and not is_end:
+            return branches[0]
+        return "(?:" + "|".join(branches) + ")" + ("?" if is_end else "")
+
+    def translate(self, text):
+        if not self.pattern or not text:
+            return text
+        return self.pattern.sub(lambda match: self.glossary[match.group(0).lower()], text)
+
+
+GLOSSARY = GlossaryTranslator.from_file()
+
+
+class SectionClassifier:
+    """
+    基于词元索引的文章分类
+
+    标题只分词一次，每个词元（以及以它开头的 2~3 词短语）在预先构建的
+    关键词 → [(板块, 权重)] 哈希表中查找并累加得分，得分最高的板块胜出，
+    同分时按配置中的板块顺序。按整词匹配，"ai" 不会误中 "said"；
+    单词查找开销与词表大小无关
+    """
+
+    TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[&-][a-z0-9]+)*")
+
+    def __init__(self, sections, default="全球"):
+        self.default = default
+        self.order = {}
+        self.index = {}
+        self.max_phrase = 1
+        for position, section in enumerate(sections):
+            self.order[section["name"]] = position
+            for keyword, weight in section["keywords"].items():
+                tokens = self.tokenize(keyword)
+                if not tokens:
+                    continue
+                self.index.setdefault(" ".join(tokens), []).append((section["name"], weight))
+                self.max_phrase = max(self.max_phrase, len(tokens))
+
+    @classmethod
+    def from_file(cls, path=SECTIONS_FILE):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                config = json.load(f)
+            return cls(config.get("sections", []), config.get("default", "全球"))
+        except (OSError, ValueError) as e:
+            print(f"读取分类词表失败：{e}")
+            return cls([])
+
+    @classmethod
+    def tokenize(cls, text):
+        return cls.TOKEN_PATTERN.findall(text.lower())
+
+    def scores(self, text):
+        """各板块得分"""
+        tokens = self.tokenize(text)
+        scores = {}
+        for i in range(len(tokens)):
+            for n in range(1, min(self.max_phrase, len(tokens) - i) + 1):
+                for section, weight in self.index.get(" ".join(tokens[i:i + n]), ()):
+                    scores[section] = scores.get(section, 0) + weight
+        return scores
+
+    def classify(self, text):
+        scores = self.scores(text)
+        if not scores:
+            return self.default
+        return min(scores, key=lambda section: (-scores[section], self.order[section]))
+
+    def classify_many(self, texts):
+        return [self.classify(text) for text in texts]
+
+
+SECTION_CLASSIFIER = SectionClassifier.from_file()
+
+
+def canonicalize_url(url):
+    """规范化文章 URL：小写协议与域名，去掉跟踪参数、片段和末尾斜杠，其余参数排序"""
+    parts = urlsplit(url.strip())
+    query = sorted(
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not key.lower().startswith("utm_") and key.lower() not in TRACKING_PARAMS
+    )
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path.rstrip("/") or "/",
+                       urlencode(query), ""))
+
+
+def simhash(text, bits=64):
+    """文本的 SimHash 指纹：以单词与相邻词对为特征，按特征哈希逐位投票"""
+    tokens = re.findall(r"[a-z0-9]+", text.lower())
+    features = tokens + [a + " " + b for a, b in zip(tokens, tokens[1:])]
+    if not features:
+        return 0
+    # 每个特征哈希展开成 0/1 字符串，按列统计 1 的个数，过半的位记为 1
+    rows = [format(int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=bits // 8).digest(), "big"),
+                   f"0{bits}b") for feature in features]
+    return int("".join("1" if column.count("1") * 2 > len(rows) else "0" for column in zip(*rows)), 2)
+
+
+def dedupe_articles(articles, max_distance=SIMHASH_MAX_DISTANCE, bands=SIMHASH_BANDS):
+    """
+    合并重复文章，保留首次出现的那篇，并带上所有副本的来源栏目（feeds）
+
+    同一规范化 URL 直接视为重复；其余按 标题 + 摘要 的 SimHash 指纹判断近似重复：
+    64 位指纹切成 bands 段（各段宽度相差不超过 1 位，覆盖全部 64 位），
+    任意一段相同的文章进入同一桶，只在桶内比较海明距离；bands > max_distance 时
+    距离不超过 max_distance 的两篇至少有一段完全相同，不会漏判
+    """
+    parent = list(range(len(articles)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def union(i, j):
+        i, j = find(i), find(j)
+        if i != j:
+            parent[max(i, j)] = min(i, j)
+
+    edges = [64 * band // bands for band in range(bands + 1)]
+    by_url = {}
+    buckets = {}
+    fingerprints = []
+    for i, article in enumerate(articles):
+        url = canonicalize_url(article["url"])
+        if url in by_url:
+            union(by_url[url], i)
+        else:
+            by_url[url] = i
+        fingerprint = simhash(f"{article['title']} {article.get('summary', '')}")
+        fingerprints.append(fingerprint)
+        for band in range(bands):
+            key = (band, fingerprint >> edges[band] & ((1 << (edges[band + 1] - edges[band])) - 1))
+            for j in buckets.get(key, ()):
+                if (fingerprints[j] ^ fingerprint).bit_count() <= max_distance:
+                    union(j, i)
+            buckets.setdefault(key, []).append(i)
+
+    merged = {}
+    for i, article in enumerate(articles):
+        root = find(i)
+        if root not in merged:
+            merged[root] = dict(article, url=canonicalize_url(article["url"]), feeds=list(article.get("feeds", [])))
+            continue
+        feeds = merged[root]["feeds"]
+        feeds.extend(feed for feed in article.get("feeds", []) if feed not in feeds)
+    return list(merged.values())
+
+
+class ArticleLinkExtractor(HTMLParser):
+    """
+    首页文章链接提取：流式分词，只关注 href 指向文章的 <a> 标签并收集其文字，
+    不构建文档树；按 URL 去重，凑够 limit 篇后置 done，调用方随即停止读取
+    """
+
+    def __init__(self, limit):
+        super().__init__(convert_charrefs=True)
+        self.limit = limit
+        self.articles = []
+        self.done = False
+        self._seen = set()
+        self._href = None
+        self._text = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag != "a" or self.done:
+            return
+        href = dict(attrs).get("href") or ""
+        if any(path in href for path in HOMEPAGE_ARTICLE_PATHS):
+            self._href = href
+            self._text = []
+        else:
+            self._href = None
+
+    def handle_data(self, data):
+        if self._href is not None:
+            self._text.append(data)
+
+    def handle_endtag(self, tag):
+        if tag != "a" or self._href is None:
+            return
+        href, self._href = self._href, None
+        title = " ".join("".join(self._text).split())
+        url = href if href.startswith("http") else f"https://www.ft.com{href}"
+        key = canonicalize_url(url)
+        if len(title) <= HOMEPAGE_MIN_TITLE or key in self._seen:
+            return
+        self._seen.add(key)
+        self.articles.append({
+            "title": title,
+            "url": url,
+            "published": datetime.now().strftime("%a, %d %b %Y %H:%M:%S GMT"),
+            "summary": "",
+        })
+        if len(self.articles) >= self.limit:
+            self.done = True
+
+
+class TranslationMemo:
+    """
+    译文缓存（SQLite）：以 规范化原文 + 语言对 + 翻译服务 的哈希为键
+
+    只有未命中的文本才去请求翻译接口；prune() 删除过期条目，并在条目过多时
+    按最近使用时间淘汰。hits / misses 记录本次运行的命中情况
+    """
+
+    def __init__(self, path=TRANSLATION_DB):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS memo ("
+            "key TEXT PRIMARY KEY, source TEXT, translated TEXT, "
+            "created REAL, last_used REAL, uses INTEGER DEFAULT 0)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS memo_last_used ON memo (last_used)")
+        self._conn.commit()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def normalize(text):
+        return " ".join(unicodedata.normalize("NFC", text).split())
+
+    def _key(self, text, langpair, provider):
+        raw = "\0".join((self.normalize(text), langpair, provider))
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, text, langpair, provider):
+        key = self._key(text, langpair, provider)
+        with self._lock:
+            row = self._conn.execute("SELECT translated FROM memo WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute("UPDATE memo SET last_used = ?, uses = uses + 1 WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+        return row[0]
+
+    def put(self, text, langpair, provider, translated):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO memo (key, source, translated, created, last_used, uses) "
+                "VALUES (?, ?, ?, ?, ?, 0)",
+                (self._key(text, langpair, provider), self.normalize(text), translated, now, now),
+            )
+            self._conn.commit()
+
+    def prune(self, max_age_days=TRANSLATION_MAX_AGE_DAYS, max_entries=TRANSLATION_MAX_ENTRIES):
+        """删除过期条目，再把条目数压到 max_entries 以内（淘汰最久未使用的）"""
+        with self._lock:
+            self._conn.execute("DELETE FROM memo WHERE created < ?", (time.time() - max_age_days * 86400,))
+            self._conn.execute(
+                "DELETE FROM memo WHERE key IN ("
+                "SELECT key FROM memo ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (max_entries,),
+            )
+            self._conn.commit()
+
+    def stats(self):
+        total = self.hits + self.misses
+        rate = f"{self.hits / total:.0%}" if total else "-"
+        return f"命中 {self.hits}，未命中 {self.misses}（命中率 {rate}）"
+
+
+class RequestThrottle:
+    """同一翻译服务的请求节流：保证两次请求间隔不小于 min_interval 秒（多线程共享）"""
+
+    def __init__(self, min_interval):
+        self.min_interval = min_interval
+        self._next_allowed = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self, deadline):
+        """等待到允许发出请求；等待会越过 deadline 时返回 False"""
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_allowed)
+            if slot >= deadline:
+                return False
+            self._next_allowed = slot + self.min_interval
+        time.sleep(slot - now)
+        return True
+
+
 class FTDigest:
     def __init__(self):
         self.session = requests.Session()
@@ -49,6 +493,8 @@ class FTDigest:
             "Accept-Language": "zh-CN,zh;q=0.9,en;q=0.8",
         })
         self.articles = []
+        self.feed_cache = FeedCache()
+        self.translation_memo = TranslationMemo()
 
     def login(self):
         """登录 FT.com"""
@@ -100,7 +546,10 @@ class FTDigest:
             try:
                 articles = source(limit)
                 if articles:
-                    self.articles = articles[:limit]
+                    unique = dedupe_articles(articles)
+                    if len(unique) < len(articles):
+                        print(f"合并重复文章：{len(articles)} → {len(unique)}")
+                    self.articles = self.classify_articles(unique[:limit])
                     print(f"✓ 成功获取 {len(self.articles)} 篇文章")
                     return True
             except Exception as e:
@@ -113,87 +562,108 @@ class FTDigest:
         return True
 
     def _fetch_from_rss(self, limit):
-        """从 RSS 获取（不需要登录）"""
-        rss_urls = [
-            "https://www.ft.com/rss/home",
-            "https://www.ft.com/rss/world",
-            "https://www.ft.com/rss/companies",
-            "https://www.ft.com/rss/technology",
-            "https://www.ft.com/rss/markets",
-        ]
+        """从 RSS 获取（不需要登录）：所有源并发请求，按源顺序合并，超时的源跳过"""
+        deadline = time.monotonic() + RSS_DEADLINE
+        pool = ThreadPoolExecutor(max_workers=len(RSS_FEEDS))
+        futures = [pool.submit(self._fetch_feed, rss_url, deadline) for rss_url in RSS_FEEDS]
+        done, not_done = wait(futures, timeout=max(0, deadline - time.monotonic()))
+        pool.shutdown(wait=False, cancel_futures=True)
 
         articles = []
-        for rss_url in rss_urls:
+        for rss_url, future in zip(RSS_FEEDS, futures):
+            if future in not_done:
+                print(f"RSS 超时跳过：{rss_url}")
+                continue
             try:
-                response = self.session.get(rss_url, timeout=10)
-                if response.status_code == 200:
-                    soup = BeautifulSoup(response.content, "xml")
-                    for item in soup.find_all("item")[:5]:
-                        title = item.find("title")
-                        link = item.find("link")
-                        pub_date = item.find("pubDate")
-                        description = item.find("description")
-
-                        if title and link:
-                            articles.append({
-                                "title": title.text.strip(),
-                                "url": link.text.strip(),
-                                "published": pub_date.text.strip() if pub_date else "",
-                                "summary": description.text.strip()[:200] if description else "",
-                                "section": self._guess_section(title.text),
-                            })
+                feed = rss_url.rstrip("/").rsplit("/", 1)[-1]
+                articles.extend(dict(item, feeds=[feed]) for item in future.result())
             except Exception as e:
-                continue
+                print(f"RSS 获取失败：{rss_url} ({e})")
+
+        self.feed_cache.save()
+        return articles
+
+    def _fetch_feed(self, rss_url, deadline):
+        """请求并解析单个 RSS 源，单次超时不越过 deadline"""
+        timeout = min(10, deadline - time.monotonic())
+        if timeout <= 0:
+            return []
+        return self.feed_cache.fetch(self.session, rss_url, self._parse_feed, timeout)
+
+    def _parse_feed(self, response, limit=RSS_ITEMS_PER_FEED):
+        """
+        流式解析 RSS 响应，返回前 limit 篇文章
 
+        边接收边喂给 XMLPullParser，每解析完一个 <item> 就取出字段并从树上移除；
+        凑够 limit 篇后立即停止读取响应，剩余内容不再下载和解析
+        """
+        articles = []
+        parser = ET.XMLPullParser(events=("start", "end"))
+        parents = []
+        try:
+            for chunk in response.iter_content(chunk_size=8192):
+                parser.feed(chunk)
+                for event, element in parser.read_events():
+                    if event == "start":
+                        parents.append(element)
+                        continue
+                    parents.pop()
+                    if element.tag.rsplit("}", 1)[-1] != "item":
+                        continue
+                    fields = {child.tag.rsplit("}", 1)[-1]: (child.text or "").strip() for child in element}
+                    if fields.get("title") and fields.get("link"):
+                        articles.append({
+                            "title": fields["title"],
+                            "url": fields["link"],
+                            "published": fields.get("pubDate", ""),
+                            "summary": fields.get("description", "")[:200],
+                        })
+                    element.clear()
+                    if parents:
+                        parents[-1].remove(element)
+                    if len(articles) >= limit:
+                        return articles
+        except ET.ParseError as e:
+            # 源内容残缺时保留已解析的条目
+            print(f"RSS 解析中断：{e}")
         return articles
 
     def _fetch_from_homepage(self, limit):
         """从首页抓取"""
         try:
-            response = self.session.get("https://www.ft.com/", timeout=10)
-            if response.status_code == 200:
-                soup = BeautifulSoup(response.content, "html.parser")
-                articles = []
-
-                # 查找文章链接
-                for link in soup.find_all("a", href=True)[:50]:
-                    href = link["href"]
-                    if "/content/" in href or "/story/" in href:
-                        title = link.get_text(strip=True)
-                        if len(title) > 20:  # 过滤短文本
-                            articles.append({
-                                "title": title,
-                                "url": href if href.startswith("http") else f"https://www.ft.com{href}",
-                                "published": datetime.now().strftime("%a, %d %b %Y %H:%M:%S GMT"),
-                                "summary": "",
-                                "section": self._guess_section(title),
-                            })
-
-                return articles[:limit]
+            articles = self.feed_cache.fetch(self.session, HOMEPAGE_URL,
+                                             lambda response: self._parse_homepage(response, limit))
+            self.feed_cache.save()
+            return [dict(item, feeds=["homepage"]) for item in articles]
         except Exception as e:
             print(f"首页抓取失败：{e}")
         return []
 
+    def _parse_homepage(self, response, limit):
+        """从首页 HTML 中流式提取前 limit 篇不重复的文章链接，够数即停止读取"""
+        extractor = ArticleLinkExtractor(limit)
+        decoder = codecs.getincrementaldecoder(response.encoding or "utf-8")(errors="replace")
+        for chunk in response.iter_content(chunk_size=16384):
+            extractor.feed(decoder.decode(chunk))
+            if extractor.done:
+                break
+        return extractor.articles
+
     def _fetch_from_api(self, limit):
         """从 API 获取（需要登录）"""
         # 需要有效的登录 session
         return []
 
     def _guess_section(self, title):
-        """猜测文章分类"""
-        title_lower = title.lower()
-        if any(k in title_lower for k in ["china", "chinese", "beijing", "shanghai"]):
-            return "中国"
-        elif any(k in title_lower for k in ["tech", "ai", "digital", "software"]):
-            return "科技"
-        elif any(k in title_lower for k in ["market", "stock", "trading"]):
-            return "市场"
-        elif any(k in title_lower for k in ["company", "business", "corporate"]):
-            return "商业"
-        elif any(k in title_lower for k in ["economy", "economic", "gdp", "inflation"]):
-            return "经济"
-        else:
-            return "全球"
+        """猜测文章分类（词表见 sections.json）"""
+        return SECTION_CLASSIFIER.classify(title)
+
+    def classify_articles(self, articles=None):
+        """批量分类：一次调用为所有文章写入 section"""
+        articles = self.articles if articles is None else articles
+        for article, section in zip(articles, SECTION_CLASSIFIER.classify_many(a["title"] for a in articles)):
+            article["section"] = section
+        return articles
 
     def _get_sample_articles(self, limit):
         """示例文章（用于测试）"""
@@ -236,118 +706,135 @@ class FTDigest:
             },
         ]
 
-    def translate_to_chinese(self, text):
-        """翻译为中文 - 使用免费翻译 API"""
-        if not text or len(text) < 5:
-            return text
+    def _mymemory_translate(self, text, timeout=5):
+        """
+        调用 MyMemory 翻译 API（免费，无需 API key），失败返回 None
 
-        try:
-            # 使用 MyMemory 翻译 API（免费，无需 API key）
-            url = f"https://api.mymemory.translated.net/get?q={requests.utils.quote(text)}&langpair=en|zh"
-            response = requests.get(url, timeout=5)
-            if response.status_code == 200:
-                result = response.json()
-                if "responseData" in result and "translatedText" in result["responseData"]:
-                    translated = result["responseData"]["translatedText"]
-                    # 清理翻译结果
-                    translated = translated.replace("&quot;", '"').replace("&amp;", "&")
-                    return translated
-        except Exception as e:
-            print(f"翻译失败：{e}")
+        额度用尽或出错时接口仍返回 HTTP 200，把提示语（如 "MYMEMORY WARNING: ..."）
+        放在 translatedText 里，需以 responseStatus / quotaFinished 判断，不能当作译文缓存
+        """
+        url = f"https://api.mymemory.translated.net/get?q={requests.utils.quote(text)}&langpair=en|zh"
+        response = requests.get(url, timeout=timeout)
+        if response.status_code == 200:
+            result = response.json()
+            if str(result.get("responseStatus")) != "200" or result.get("quotaFinished"):
+                print(f"MyMemory 返回错误（{result.get('responseStatus')}）："
+                      f"{str(result.get('responseDetails') or '')[:80]}")
+                return None
+            if "responseData" in result and "translatedText" in result["responseData"]:
+                translated = result["responseData"]["translatedText"]
+                # 清理翻译结果
+                return translated.replace("&quot;", '"').replace("&amp;", "&")
+        return None
+
+    def translate_batch(self, texts, deadline=None):
+        """
+        批量翻译，返回 {原文: 译文}
+
+        去重后先查译文缓存；未命中的短文本按 TRANSLATION_BATCH_CHARS 用换行打包，
+        由有界线程池并发请求并按服务节流。打包依赖服务逐行保留换行，一旦结果行数
+        对不上，本次运行即停用打包，尚未完成的打包批次拆成单条重新提交；
+        截止时间前没有拿到译文的文本使用离线关键词翻译
+        """
+        deadline = deadline or time.monotonic() + TRANSLATION_DEADLINE
+        results = {}
+        pending = []
+        for text in dict.fromkeys(texts):
+            if not text or len(text) < 5:
+                results[text] = text
+                continue
+            cached = self.translation_memo.get(text, "en|zh", "mymemory")
+            if cached is not None:
+                results[text] = cached
+            else:
+                pending.append(text)
+
+        batches, batch, size = [], [], 0
+        for text in pending:
+            if "\n" in text or len(text) > TRANSLATION_BATCH_CHARS:
+                batches.append([text])
+                continue
+            if batch and size + len(text) + 1 > TRANSLATION_BATCH_CHARS:
+                batches.append(batch)
+                batch, size = [], 0
+            batch.append(text)
+            size += len(text) + 1
+        if batch:
+            batches.append(batch)
+
+        throttle = RequestThrottle(TRANSLATION_MIN_INTERVAL["mymemory"])
+        packing = threading.Event()
+        packing.set()
+
+        def translate_one(batch):
+            """翻译一个打包批次；返回 None 表示需要拆成单条重试（行数对不上或打包已停用）"""
+            if len(batch) > 1 and not packing.is_set():
+                return None
+            if not throttle.wait(deadline):
+                return {}
+            translated = self._mymemory_translate("\n".join(batch),
+                                                  timeout=max(0.1, min(5, deadline - time.monotonic())))
+            if not translated:
+                return {}
+            if len(batch) == 1:
+                return {batch[0]: translated}
+            lines = translated.split("\n")
+            if len(lines) != len(batch):
+                return None
+            return dict(zip(batch, (line.strip() for line in lines)))
+
+        if batches:
+            pool = ThreadPoolExecutor(max_workers=min(TRANSLATION_WORKERS, len(batches)))
+            futures = {pool.submit(translate_one, batch): batch for batch in batches}
+            while futures and time.monotonic() < deadline:
+                done, _ = wait(futures, timeout=max(0, deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+                for future in done:
+                    batch = futures.pop(future)
+                    try:
+                        translated_batch = future.result()
+                    except Exception as e:
+                        print(f"翻译失败：{e}")
+                        continue
+                    if translated_batch is None:
+                        # 服务合并或拆分了行：停用打包，逐条重新提交
+                        if packing.is_set():
+                            packing.clear()
+                            print("翻译结果行数与打包批次不一致，本次运行改为逐条翻译")
+                        for text in batch:
+                            futures[pool.submit(translate_one, [text])] = [text]
+                        continue
+                    for text, translated in translated_batch.items():
+                        self.translation_memo.put(text, "en|zh", "mymemory", translated)
+                        results[text] = translated
+            pool.shutdown(wait=False, cancel_futures=True)
+
+        fallback = [text for text in pending if text not in results]
+        if fallback:
+            print(f"{len(fallback)} 条文本未能通过接口翻译（失败或超时），使用关键词翻译")
+        for text in fallback:
+            results[text] = self._simple_translate(text)
+        return results
+
+    def translate_articles(self):
+        """渲染前的翻译阶段：一次性翻译所有标题与摘要，写入 title_zh / summary_zh"""
+        texts = []
+        for article in self.articles:
+            texts.append(article["title"])
+            summary = article.get("summary", "")[:150]
+            if summary:
+                texts.append(summary)
 
-        # 备用方案：关键词替换
-        return self._simple_translate(text)
+        started = time.monotonic()
+        translations = self.translate_batch(texts)
+        for article in self.articles:
+            article["title_zh"] = translations[article["title"]]
+            summary = article.get("summary", "")[:150]
+            article["summary_zh"] = translations[summary] if summary else ""
+        print(f"✓ 翻译完成：{len(set(texts))} 条文本，用时 {time.monotonic() - started:.1f}s")
 
     def _simple_translate(self, text):
-        """简单关键词翻译（备用方案）"""
-        translations = {
-            "Federal Reserve": "美联储",
-            "Fed": "美联储",
-            "Wall Street": "华尔街",
-            "Stock Market": "股市",
-            "Bond Market": "债市",
-            "European": "欧洲的",
-            "Asia": "亚洲",
-            "China": "中国",
-            "Chinese": "中国的",
-            "US": "美国",
-            "UK": "英国",
-            "Germany": "德国",
-            "Japan": "日本",
-            "inflation": "通胀",
-            "interest rates": "利率",
-            "rate cuts": "降息",
-            "rate hike": "加息",
-            "GDP": "国内生产总值",
-            "economy": "经济",
-            "economic": "经济",
-            "stocks": "股票",
-            "shares": "股票",
-            "investors": "投资者",
-            "markets": "市场",
-            "tech": "科技",
-            "technology": "科技",
-            "Artificial Intelligence": "人工智能",
-            "AI": "人工智能",
-            "companies": "公司",
-            "business": "商业",
-            "banking": "银行业",
-            "finance": "金融",
-            "oil": "石油",
-            "energy": "能源",
-            "gold": "黄金",
-            "dollar": "美元",
-            "currency": "货币",
-            "trade": "贸易",
-            "manufacturing": "制造业",
-            "housing": "房地产",
-            "retail": "零售",
-            "healthcare": "医疗保健",
-            "pharmaceutical": "制药",
-            "electric vehicles": "电动汽车",
-            "semiconductor": "半导体",
-            "chips": "芯片",
-            "earnings": "财报",
-            "profits": "利润",
-            "revenue": "收入",
-            "CEO": "首席执行官",
-            "merger": "并购",
-            "acquisition": "收购",
-            "startup": "初创公司",
-            "climate": "气候",
-            "renewable energy": "可再生能源",
-            "cryptocurrency": "加密货币",
-            "Bitcoin": "比特币",
-            "Trump": "特朗普",
-            "Biden": "拜登",
-            "election": "选举",
-            "policy": "政策",
-            "tariffs": "关税",
-            "supply chain": "供应链",
-            "housing market": "房地产市场",
-            "unemployment": "失业",
-            "jobs": "就业",
-            "consumers": "消费者",
-            "spending": "支出",
-            "growth": "增长",
-            "recession": "衰退",
-            "crisis": "危机",
-            "bank": "银行",
-            "investment": "投资",
-            "fund": "基金",
-            "portfolio": "投资组合",
-            "risk": "风险",
-            "returns": "回报",
-        }
-
-        result = text
-        # 先翻译长短语，再翻译单词
-        sorted_trans = sorted(translations.items(), key=lambda x: len(x[0]), reverse=True)
-        for en, zh in sorted_trans:
-            # 使用正则表达式确保单词边界
-            result = re.sub(r'\b' + re.escape(en) + r'\b', zh, result, flags=re.IGNORECASE)
-
-        return result
+        """简单关键词翻译（备用方案），词表见 glossary.json"""
+        return GLOSSARY.translate(text)
 
     def generate_html_email(self):
         """生成 HTML 邮件"""
@@ -383,10 +870,11 @@ class FTDigest:
             """
 
             for article in articles:
-                title_zh = self.translate_to_chinese(article["title"])
-                summary = article.get("summary", "")[:150]
-                if summary:
-                    summary = self.translate_to_chinese(summary)
+                # 译文由 translate_articles() 预先生成；未经过翻译阶段时用离线关键词翻译
+                title_zh = article.get("title_zh") or self._simple_translate(article["title"])
+                summary = article.get("summary_zh")
+                if summary is None:
+                    summary = self._simple_translate(article.get("summary", "")[:150])
 
                 news_html += f"""
                 <div class="news-item">
@@ -395,6 +883,7 @@ class FTDigest:
                     </div>
                     <div class="news-meta">
                         <span>🔗 <a href="{article['url']}" style="color: {color};">阅读原文</a></span>
+                        {"<span> · 栏目：" + " / ".join(article["feeds"]) + "</span>" if article.get("feeds") else ""}
                     </div>
                     {"<div class='news-summary'>" + summary + "</div>" if summary else ""}
                 </div>
@@ -565,19 +1054,24 @@ class FTDigest:
         # 2. 获取文章
         self.fetch_articles(limit=15)
 
-        # 3. 生成 HTML
+        # 3. 翻译标题与摘要
+        self.translate_articles()
+        print(f"翻译缓存：{self.translation_memo.stats()}")
+        self.translation_memo.prune()
+
+        # 4. 生成 HTML
         html_content = self.generate_html_email()
 
-        # 4. 保存 HTML
+        # 5. 保存 HTML
         self.save_html(html_content)
 
-        # 5. 发送邮件
+        # 6. 发送邮件
         if SMTP_PASS:
             self.send_email(html_content)
         else:
             print("⚠ 未配置 SMTP 密码，跳过邮件发送")
 
-        # 6. 发送钉钉提醒
+        # 7. 发送钉钉提醒
         self.send_dingtalk()
 
         print("=" * 50)
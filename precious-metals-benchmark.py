@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+贵金属监控基准测试
+在本机启动币安、CoinGecko、ExchangeRate-API、Open ER-API、Gold API 与钉钉 webhook 的替身服务，
+把 precious-metals-monitor.py 的接口地址指向它们，端到端运行 main() N 次，
+统计耗时分位数、各上游请求数与重试次数。完全离线，可用于跟踪性能回归。
+
+用法:
+    python3 precious-metals-benchmark.py --runs 30
+    python3 precious-metals-benchmark.py --latency 80 --error-rate 0.1 --rate-429 0.05
+    python3 precious-metals-benchmark.py --upstream binance:latency=1500 --upstream coingecko:errors=0.5
+    python3 precious-metals-benchmark.py --json bench.json
+"""
+
+import argparse
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+# ==================== 配置区域 ====================
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+MONITOR_FILE = os.path.join(SCRIPT_DIR, "precious-metals-monitor.py")
+
+# 替身服务：名称 -> 被替换的真实地址前缀
+UPSTREAMS = {
+    'binance': "https://api.binance.com",
+    'coingecko': "https://api.coingecko.com",
+    'exchangerate': "https://api.exchangerate-api.com",
+    'open-er': "https://open.er-api.com",
+    'gold-api': "https://api.gold-api.com",
+    'dingtalk': "https://oapi.dingtalk.com",
+}
+
+# 替身行情（USD）
+STUB_TICKERS = {
+    'PAXGUSDT': 2650.0, 'SILVERUSDT': 31.2, 'BTCUSDT': 97000.0, 'ETHUSDT': 3400.0,
+    'BNBUSDT': 690.0, 'SOLUSDT': 190.0, 'XRPUSDT': 2.3,
+}
+STUB_COINGECKO = {
+    'bitcoin': 97000.0, 'ethereum': 3400.0, 'binancecoin': 690.0, 'solana': 190.0, 'ripple': 2.3,
+    'pax-gold': 2650.0, 'wrapped-silver': 31.2,
+}
+STUB_METALS = {'XAU': 2650.0, 'XAG': 31.2, 'XPT': 980.0, 'XPD': 1010.0}
+STUB_FX_RATES = {'USD': 1.0, 'CNY': 7.25, 'HKD': 7.8, 'EUR': 0.92, 'JPY': 151.0, 'GBP': 0.79}
+
+
+# ==================== 替身服务 ====================
+
+class UpstreamBehavior:
+    """单个替身服务的注入参数：延迟（毫秒）、抖动（毫秒）、5xx 比例、429 比例"""
+
+    def __init__(self, latency=50.0, jitter=20.0, error_rate=0.0, rate_429=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_429 = rate_429
+
+    def update(self, spec):
+        """解析 latency=800,jitter=100,errors=0.2,429=0.1 形式的覆盖参数"""
+        for item in spec.split(','):
+            key, _, value = item.partition('=')
+            key = {'errors': 'error_rate', '429': 'rate_429'}.get(key.strip(), key.strip())
+            if not hasattr(self, key):
+                raise ValueError(f"未知参数：{key}")
+            setattr(self, key, float(value))
+
+
+class StandInServer:
+    """在本机随机端口运行的替身 HTTP 服务，记录每次请求的状态码"""
+
+    def __init__(self, name, behavior, rng):
+        self.name = name
+        self.behavior = behavior
+        self.rng = rng
+        self.counts = {'requests': 0, 'ok': 0, 'not_modified': 0, 'errors': 0, 'rate_limited': 0}
+        self._lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), self._handler_class())
+        self.httpd.daemon_threads = True
+        self.base_url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def _count(self, key):
+        with self._lock:
+            self.counts[key] += 1
+
+    def _draw(self):
+        """抽取本次请求的延迟（秒）与注入结果"""
+        with self._lock:
+            delay = max(0.0, self.rng.gauss(self.behavior.latency, self.behavior.jitter)) / 1000
+            roll = self.rng.random()
+        if roll < self.behavior.rate_429:
+            return delay, 429
+        if roll < self.behavior.rate_429 + self.behavior.error_rate:
+            return delay, 500
+        return delay, 200
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _reply(self, status, body=None, headers=None):
+                data = json.dumps(body).encode() if body is not None else b''
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _handle(self):
+                server._count('requests')
+                delay, status = server._draw()
+                time.sleep(delay)
+                if status == 429:
+                    server._count('rate_limited')
+                    return self._reply(429, {'error': 'rate limited'}, {'Retry-After': '1'})
+                if status == 500:
+                    server._count('errors')
+                    return self._reply(500, {'error': 'injected failure'})
+                body, headers = server.respond(self.path, self.headers)
+                if body is None and headers is None:
+                    server._count('errors')
+                    return self._reply(404, {'error': 'unknown path'})
+                if body is None:
+                    server._count('not_modified')
+                    return self._reply(304, None, headers)
+                server._count('ok')
+                return self._reply(200, body, headers)
+
+            do_GET = _handle
+            do_POST = _handle
+
+        return Handler
+
+    def respond(self, path, request_headers):
+        """按服务名生成响应体，返回 (body, headers)；body 为 None 且 headers 非 None 表示 304"""
+        parsed = urlparse(path)
+        query = {key: values[0] for key, values in parse_qs(parsed.query).items()}
+        if self.name == 'binance' and parsed.path.endswith('/ticker/24hr'):
+            if 'symbols' in query:
+                symbols = json.loads(query['symbols'])
+                return [_binance_ticker(s) for s in symbols if s in STUB_TICKERS], {}
+            if query.get('symbol') in STUB_TICKERS:
+                return _binance_ticker(query['symbol']), {}
+            return {'code': -1121, 'msg': 'Invalid symbol.'}, {}
+        if self.name == 'coingecko' and parsed.path.endswith('/simple/price'):
+            return {
+                coin_id: {'usd': STUB_COINGECKO[coin_id], 'usd_24h_change': 0.8,
+                          'usd_24h_vol': 1.2e10, 'usd_market_cap': 1.9e12}
+                for coin_id in query.get('ids', '').split(',') if coin_id in STUB_COINGECKO
+            }, {}
+        if self.name in ('exchangerate', 'open-er') and parsed.path.endswith('/latest/USD'):
+            etag = '"fx-stub-1"'
+            if request_headers.get('If-None-Match') == etag:
+                return None, {'ETag': etag}
+            return {'base': 'USD', 'rates': STUB_FX_RATES}, {'ETag': etag}
+        if self.name == 'gold-api':
+            code = parsed.path.rstrip('/').rsplit('/', 1)[-1]
+            if code in STUB_METALS:
+                return {'name': code, 'price': STUB_METALS[code], 'symbol': code}, {}
+        if self.name == 'dingtalk' and parsed.path.endswith('/robot/send'):
+            return {'errcode': 0, 'errmsg': 'ok'}, {}
+        return None, None
+
+
+def _binance_ticker(symbol):
+    return {
+        'symbol': symbol, 'lastPrice': str(STUB_TICKERS[symbol]), 'priceChangePercent': '0.85',
+        'quoteVolume': '1250000000.0', 'volume': '15000.0',
+    }
+
+
+# ==================== 被测脚本接线 ====================
+
+def load_monitor():
+    """按路径导入 precious-metals-monitor.py（文件名含连字符）"""
+    spec = importlib.util.spec_from_file_location('precious_metals_monitor', MONITOR_FILE)
+    monitor = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(monitor)
+    return monitor
+
+
+def wire_monitor(monitor, servers, state_dir, rate_limits=False):
+    """把被测脚本的接口地址、状态目录与配置文件全部指向替身服务和临时目录"""
+
+    def rewrite(url):
+        for name, prefix in UPSTREAMS.items():
+            if url.startswith(prefix):
+                return servers[name].base_url + url[len(prefix):]
+        return url
+
+    monitor.BINANCE_API = rewrite(monitor.BINANCE_API)
+    monitor.COINGECKO_API = rewrite(monitor.COINGECKO_API)
+    monitor.DINGTALK_WEBHOOK = rewrite(monitor.DINGTALK_WEBHOOK)
+    for name in ('GOLD_SOURCES', 'SILVER_SOURCES', 'BTC_SOURCES', 'FX_SOURCES'):
+        setattr(monitor, name, [(label, rewrite(url), parse) for label, url, parse in getattr(monitor, name)])
+
+    # 配置文件中的地址同样改写后放到临时目录
+    for attr in ('GOLD_CONFIG_FILE', 'CRYPTO_CONFIG_FILE'):
+        with open(getattr(monitor, attr), 'r', encoding='utf-8') as f:
+            config = json.load(f)
+        if config.get('baseUrl'):
+            config['baseUrl'] = rewrite(config['baseUrl'])
+        if 'rateLimits' in config:
+            config['rateLimits'] = {urlparse(rewrite(f"https://{host}")).netloc: spec
+                                    for host, spec in config['rateLimits'].items()}
+        path = os.path.join(state_dir, os.path.basename(getattr(monitor, attr)))
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(config, f, ensure_ascii=False)
+        setattr(monitor, attr, path)
+
+    reset_monitor_state(monitor, state_dir, rate_limits)
+
+
+def reset_monitor_state(monitor, state_dir, rate_limits=False):
+    """让被测脚本的全部持久化状态落在 state_dir 下"""
+    monitor_state = os.path.join(state_dir, "state")
+    monitor.STATE_DIR = monitor_state
+    monitor.ALERT_RULES_FILE = os.path.join(state_dir, "no-alert-rules.json")
+    monitor.CHART_DIR = os.path.join(monitor_state, "charts")
+    monitor.SOURCE_HEALTH = monitor.SourceHealthRegistry(os.path.join(monitor_state, monitor.HEALTH_FILE))
+    monitor.FX_CACHE = monitor.FxRateCache(os.path.join(monitor_state, "fx-cache.json"))
+    monitor.TICK_STORE = monitor.TickStore(os.path.join(monitor_state, "ticks"))
+    monitor.KLINE_STORE = monitor.KlineStore(os.path.join(monitor_state, "klines"))
+    limiter_path = os.path.join(monitor_state, monitor.RATE_LIMIT_FILE)
+    if rate_limits:
+        monitor.RATE_LIMITER = monitor.ProviderRateLimiter.from_config(limiter_path, monitor.CRYPTO_CONFIG_FILE)
+    else:
+        monitor.RATE_LIMITER = monitor.ProviderRateLimiter(limiter_path, {})
+
+
+# ==================== 基准测试 ====================
+
+def run_benchmark(args):
+    rng = random.Random(args.seed)
+    behaviors = {
+        name: UpstreamBehavior(args.latency, args.jitter, args.error_rate, args.rate_429)
+        for name in UPSTREAMS
+    }
+    for override in args.upstream:
+        name, _, spec = override.partition(':')
+        if name not in behaviors:
+            raise SystemExit(f"未知替身服务：{name}（可选：{', '.join(UPSTREAMS)}）")
+        behaviors[name].update(spec)
+
+    servers = {name: StandInServer(name, behavior, rng).start() for name, behavior in behaviors.items()}
+    state_dir = tempfile.mkdtemp(prefix="metals-bench-")
+    monitor = load_monitor()
+    wire_monitor(monitor, servers, state_dir, args.rate_limits)
+
+    # --force：每次都发送完整报告，--no-charts：走势图需要钉钉上传，不在离线基准范围内
+    argv = ['--force', '--no-charts'] + (['--no-hedge'] if args.no_hedge else [])
+    durations = []
+    failures = 0
+    try:
+        for run in range(args.runs):
+            if args.fresh_state and run > 0:
+                shutil.rmtree(os.path.join(state_dir, "state"), ignore_errors=True)
+                reset_monitor_state(monitor, state_dir, args.rate_limits)
+            output = io.StringIO()
+            started = time.perf_counter()
+            try:
+                with contextlib.redirect_stdout(output if not args.verbose else sys.stdout):
+                    monitor.main(argv)
+            except Exception as e:
+                failures += 1
+                print(f"第 {run + 1} 次运行异常：{e}")
+            durations.append(time.perf_counter() - started)
+            if not args.verbose:
+                print(f"\r运行 {run + 1}/{args.runs}  {durations[-1] * 1000:8.1f} ms", end="", flush=True)
+        print()
+    finally:
+        for server in servers.values():
+            server.stop()
+        shutil.rmtree(state_dir, ignore_errors=True)
+
+    durations_ms = np.array(durations) * 1000
+    return {
+        'runs': args.runs,
+        'failures': failures,
+        'latency_ms': {
+            'p50': float(np.percentile(durations_ms, 50)),
+            'p95': float(np.percentile(durations_ms, 95)),
+            'p99': float(np.percentile(durations_ms, 99)),
+            'mean': float(durations_ms.mean()),
+            'max': float(durations_ms.max()),
+        },
+        'client': dict(monitor.FETCH_STATS),
+        'upstreams': {
+            name: dict(server.counts, latency_ms=behaviors[name].latency, error_rate=behaviors[name].error_rate,
+                       rate_429=behaviors[name].rate_429)
+            for name, server in servers.items()
+        },
+    }
+
+
+def print_results(results):
+    latency = results['latency_ms']
+    runs = results['runs']
+    print("\n" + "=" * 64)
+    print(f"运行 {runs} 次，异常 {results['failures']} 次")
+    print(f"耗时  p50 {latency['p50']:.1f} ms | p95 {latency['p95']:.1f} ms | "
+          f"p99 {latency['p99']:.1f} ms | 平均 {latency['mean']:.1f} ms | 最大 {latency['max']:.1f} ms")
+    client = results['client']
+    print(f"客户端  请求 {client['requests']}（每次 {client['requests'] / runs:.1f}）| "
+          f"重试 {client['retries']} | 限流 {client['rate_limited']}")
+    print(f"\n{'替身服务':<14}{'请求':>6}{'成功':>6}{'304':>6}{'错误':>6}{'429':>6}   注入（延迟/错误/429）")
+    for name, counts in results['upstreams'].items():
+        print(f"{name:<14}{counts['requests']:>6}{counts['ok']:>6}{counts['not_modified']:>6}"
+              f"{counts['errors']:>6}{counts['rate_limited']:>6}   "
+              f"{counts['latency_ms']:.0f}ms / {counts['error_rate']:.0%} / {counts['rate_429']:.0%}")
+    print("=" * 64)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='贵金属监控离线基准测试')
+    parser.add_argument('--runs', type=int, default=20, help='端到端运行 main() 的次数（默认 20）')
+    parser.add_argument('--latency', type=float, default=50, help='替身服务平均延迟毫秒（默认 50）')
+    parser.add_argument('--jitter', type=float, default=20, help='延迟标准差毫秒（默认 20）')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='返回 500 的比例（默认 0）')
+    parser.add_argument('--rate-429', type=float, default=0.0, help='返回 429 的比例（默认 0）')
+    parser.add_argument('--upstream', action='append', default=[], metavar='NAME:KEY=VALUE,...',
+                        help='单独设置某个替身服务，如 binance:latency=1500,errors=0.2,429=0.1')
+    parser.add_argument('--fresh-state', action='store_true',
+                        help='每次运行前清空健康度、汇率缓存等状态（模拟冷启动）')
+    parser.add_argument('--rate-limits', action='store_true',
+                        help='启用 crypto-api-config.json 中的本地限流（默认关闭以测纯耗时）')
+    parser.add_argument('--no-hedge', action='store_true', help='关闭对冲请求')
+    parser.add_argument('--seed', type=int, default=1, help='注入随机数种子（默认 1）')
+    parser.add_argument('--json', metavar='PATH', help='把结果写入 JSON 文件，便于对比回归')
+    parser.add_argument('--verbose', action='store_true', help='显示被测脚本的输出')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = run_benchmark(args)
+    print_results(results)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"结果已写入：{args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,14 +7,35 @@
 - 白银：币安 XAG/USDT 或其他来源
 - 比特币：CoinGecko API
 - 汇率：ExchangeRate-API
+
+依赖：requests、numpy（推流模式另需 websockets）
 """
 
+import argparse
+import bisect
+import fcntl
+import importlib.util
+import json
+import math
+import os
+import numpy as np
 import requests
+import sqlite3
+import struct
+import sys
+import threading
 import time
-from datetime import datetime
+import zlib
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timedelta, timezone
+from urllib.parse import parse_qs, quote, urlparse
 
 # ==================== 配置区域 ====================
 
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+# 运行状态（数据源健康度等）的持久化目录
+STATE_DIR = os.path.join(SCRIPT_DIR, ".metals-monitor")
+
 # 钉钉机器人配置
 DINGTALK_WEBHOOK = "https://oapi.dingtalk.com/robot/send?access_token=a28857b2fb6219f617702dda638035351329fd6dd4fdcc8ac875f4ff8fb698bf"
 
@@ -22,19 +43,518 @@ DINGTALK_WEBHOOK = "https://oapi.dingtalk.com/robot/send?access_token=a28857b2fb
 COINGECKO_API = "https://api.coingecko.com/api/v3"
 BINANCE_API = "https://api.binance.com/api/v3"
 
+# 汇率缓存：有效期（秒）、后台刷新截止时间（秒）、全部失败时的默认值
+FX_CACHE_TTL = 6 * 3600
+FX_REFRESH_DEADLINE = 15
+FX_DEFAULT_USD_CNY = 7.25
+
+# 多币种价格矩阵：币种、计价单位（每单位折合盎司数）
+PRICE_CURRENCIES = ("CNY", "USD", "HKD", "SGD", "JPY")
+PRICE_UNITS = {
+    "gram": 1 / 31.1035,
+    "oz": 1.0,
+    "tael": 37.429 / 31.1035,  # 香港金衡两 37.429 克
+    "kg": 1000 / 31.1035,
+}
+UNIT_NAMES = {"gram": "克", "oz": "盎司", "tael": "两", "kg": "千克"}
+CURRENCY_SYMBOLS = {"CNY": "¥", "USD": "$", "HKD": "HK$", "SGD": "S$", "JPY": "JP¥"}
+ASSET_NAMES = {"XAU": "黄金", "XAG": "白银", "XPT": "铂金", "XPD": "钯金"}
+# 报告中“多币种价格”展示的单元格：(资产, 币种, 单位)
+REPORT_LOCAL_PRICES = [
+    ("XAU", "HKD", "tael"),
+    ("XAU", "SGD", "gram"),
+    ("XAU", "JPY", "kg"),
+    ("XAG", "HKD", "tael"),
+    ("XAG", "SGD", "gram"),
+    ("XAG", "JPY", "kg"),
+]
+
+# 自选资产配置（金属代码、加密货币 watchlist）
+GOLD_CONFIG_FILE = os.path.join(SCRIPT_DIR, "gold-price-config.json")
+CRYPTO_CONFIG_FILE = os.path.join(SCRIPT_DIR, "crypto-api-config.json")
+
+# 整份报告的数据采集截止时间（秒）
+REPORT_DEADLINE = 20
+
+# 对冲请求：主源超过该时长（秒，建议取主源 p90 延迟）仍未返回时，同时启动备用源
+HEDGE_ENABLED = True
+HEDGE_DELAY = 1.5
+
+# 数据源健康度：EWMA 平滑系数、连续失败多少次熔断、熔断持续时长（秒）
+HEALTH_FILE = "source-health.json"
+HEALTH_EWMA_ALPHA = 0.3
+HEALTH_MIN_SUCCESS_RATE = 0.5
+CIRCUIT_FAILURE_THRESHOLD = 3
+CIRCUIT_OPEN_SECONDS = 600
+
+# 跨进程限流：令牌桶状态文件、令牌不足时最多等待的秒数、429 未带 Retry-After 时的冷却秒数
+RATE_LIMIT_FILE = "rate-limits.sqlite"
+RATE_LIMIT_MAX_WAIT = 5
+RATE_LIMIT_DEFAULT_RETRY_AFTER = 60
+
+# 推流模式（--stream）：币安组合 @ticker 推流
+BINANCE_WS_URL = "wss://stream.binance.com:9443/stream"
+STREAM_GOLD_SYMBOL = "PAXGUSDT"
+STREAM_SILVER_SYMBOL = "SILVERUSDT"
+STREAM_BTC_SYMBOL = "BTCUSDT"
+STREAM_SYMBOLS = [STREAM_GOLD_SYMBOL, STREAM_BTC_SYMBOL]  # 可追加其他交易对
+STREAM_REPORT_INTERVAL = 3600  # 定时推送间隔（秒）
+STREAM_ALERT_PCT = 1.0  # 相对上次推送变动超过该百分比立即推送
+STREAM_MAX_BACKOFF = 60  # 重连退避上限（秒）
+STREAM_SAMPLE_INTERVAL = 60  # 推流行情写入时间序列的最小间隔（秒）
+STREAM_PUSH_RETRY = 5  # 钉钉推送额度（每分钟 20 条，见 crypto-api-config.json rateLimits）用尽后多久再尝试（秒）
+# 推流交易对对应的时间序列资产 id
+STREAM_ASSET_IDS = {"PAXGUSDT": "XAU", "SILVERUSDT": "XAG", "BTCUSDT": "bitcoin"}
+
+# 历史 K 线回补（--backfill）：并发窗口数、每页根数、单次请求权重、每分钟权重预算
+BACKFILL_WORKERS = 8
+BACKFILL_PAGE_LIMIT = 1000
+BACKFILL_REQUEST_WEIGHT = 2
+BACKFILL_WEIGHT_BUDGET = 4800  # 币安上限 6000/分钟，留出余量给其他请求
+# 资产 id 对应的回补交易对（技术指标会先用回补的 K 线再接实时采样）
+KLINE_SYMBOLS = {"XAU": "PAXGUSDT", "bitcoin": "BTCUSDT"}
+
+# 技术指标：重采样 bar 长度（秒）、回看天数，窗口均以 bar 数计
+ANALYTICS_ASSETS = ("XAU", "XAG", "bitcoin")
+ANALYTICS_BAR_SECONDS = 3600
+ANALYTICS_LOOKBACK_DAYS = 365 * 5
+ANALYTICS_VOL_WINDOW = 24
+ANALYTICS_FAST_WINDOW = 24
+ANALYTICS_SLOW_WINDOW = 168
+ANALYTICS_EMA_TRUNCATION = 4  # EMA 核截断为 span 的倍数，慢线需要 4*168 个 bar 才有值
+ANALYTICS_CROSS_LOOKBACK = 6
+ANALYTICS_DRAWDOWN_ALERT = 10  # 回撤超过该百分比时在点评中提示
+
+# 分位数草图（金银比与日收益率）：t-digest 压缩参数、给出百分位所需的最少天数
+SKETCH_FILE = "quantile-sketches.json"
+SKETCH_COMPRESSION = 100
+SKETCH_MIN_SAMPLES = 30
+
+# 报告走势图：资产、时间窗口（秒）、图片尺寸（像素）；上传后的 media_id 钉钉保留 3 天，提前过期重传
+# 整个走势图阶段（取令牌 + 并发上传）不超过 CHART_DEADLINE 秒，超时未完成的图本次不附带
+CHART_ASSETS = ("XAU", "XAG", "bitcoin", "ethereum", "solana")
+CHART_WINDOWS = {"24h": 86400, "7d": 7 * 86400}
+CHART_WIDTH = 240
+CHART_HEIGHT = 60
+CHART_DIR = os.path.join(STATE_DIR, "charts")
+CHART_MEDIA_TTL = 60 * 3600
+CHART_DEADLINE = 15
+CHART_UPLOAD_WORKERS = 4
+DINGTALK_SENDER_DIR = os.path.join(SCRIPT_DIR, "dingtalk-file-sender")
+
+# 价格预警规则（格式见 metals-alert-rules.example.json）
+ALERT_RULES_FILE = os.path.join(SCRIPT_DIR, "metals-alert-rules.json")
+ALERT_DEFAULT_COOLDOWN = 3600  # 同一规则两次报警的最小间隔（秒）
+ALERT_DEFAULT_HYSTERESIS_PCT = 0.5  # 回撤超过阈值的该百分比才重新武装
+ALERT_CHANGE_1H_TOLERANCE = 600  # 计算 1h 涨跌幅时允许的历史样本偏差（秒）
+
+# 变化抑制：较上次推送变动超过阈值（百分比）才推送，否则每隔 NOTIFY_HEARTBEAT 秒推送一次完整报告
+NOTIFY_STATE_FILE = "last-report.json"
+NOTIFY_THRESHOLDS = {'gold': 0.5, 'silver': 1.0, 'bitcoin': 2.0, 'usd_to_cny': 0.3}
+NOTIFY_HEARTBEAT = 6 * 3600
+NOTIFY_DELTA_ONLY = False  # 因变动触发时只推送精简的变动消息（也可用 --delta-only）
+
+# ==================== 数据源健康度 ====================
+
+class RequestAborted(Exception):
+    """请求在发出前被放弃（已取消或已超过截止时间），不计入数据源健康度"""
+
+
+def _endpoint_key(url):
+    """
+    健康度统计键：接口域名 + 请求的交易对/币种，例如 api.binance.com [PAXGUSDT]；
+    批量请求统一记为 [batch]
+    """
+    parsed = urlparse(url)
+    query = parse_qs(parsed.query)
+    if 'symbols' in query or ',' in query.get('ids', [''])[0]:
+        return f"{parsed.netloc} [batch]"
+    tag = query.get('symbol') or query.get('ids')
+    return f"{parsed.netloc} [{tag[0]}]" if tag else parsed.netloc
+
+
+class SourceHealthRegistry:
+    """
+    记录每个接口（域名 + 交易对）的延迟与成功率（EWMA），跨运行持久化到 STATE_DIR
+
+    - rank() 把健康且最快的数据源排在前面
+    - 连续失败达到阈值的接口熔断 CIRCUIT_OPEN_SECONDS 秒，期间直接跳过（即使链上没有其他源）；
+      熔断到期后只放行一次试探请求（半开），成功则恢复，失败则重新熔断
+    """
+
+    LATENCY_SAMPLES = 50
+
+    def __init__(self, path):
+        self.path = path
+        self.endpoints = None
+        self._lock = threading.Lock()
+
+    def _ensure_loaded(self):
+        if self.endpoints is not None:
+            return
+        self.endpoints = {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.endpoints = json.load(f)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"读取数据源健康度失败，重新统计：{e}")
+
+    def save(self):
+        """原子写入健康度文件"""
+        with self._lock:
+            if self.endpoints is None:
+                return
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.endpoints, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+
+    def record(self, url, ok, latency, error=None):
+        """记录一次请求结果"""
+        endpoint = _endpoint_key(url)
+        with self._lock:
+            self._ensure_loaded()
+            stats = self.endpoints.setdefault(endpoint, {
+                'latency_ewma': latency,
+                'success_ewma': 1.0 if ok else 0.0,
+                'latency_samples': [],
+                'requests': 0,
+                'failures': 0,
+                'consecutive_failures': 0,
+                'circuit_open_until': 0,
+                'last_error': None,
+            })
+            alpha = HEALTH_EWMA_ALPHA
+            stats['requests'] += 1
+            stats['success_ewma'] = alpha * (1.0 if ok else 0.0) + (1 - alpha) * stats['success_ewma']
+            stats['updated'] = time.time()
+            if ok:
+                stats['latency_ewma'] = alpha * latency + (1 - alpha) * stats['latency_ewma']
+                stats['latency_samples'] = (stats['latency_samples'] + [round(latency, 3)])[-self.LATENCY_SAMPLES:]
+                stats['consecutive_failures'] = 0
+                stats['circuit_open_until'] = 0
+                stats.pop('probe_started', None)
+            else:
+                stats['failures'] += 1
+                stats['consecutive_failures'] += 1
+                stats['last_error'] = str(error)[:200] if error else None
+                if stats['consecutive_failures'] >= CIRCUIT_FAILURE_THRESHOLD:
+                    already_open = stats['circuit_open_until'] > time.time()
+                    stats['circuit_open_until'] = time.time() + CIRCUIT_OPEN_SECONDS
+                    stats.pop('probe_started', None)
+                    if not already_open:
+                        print(f"⚡ {endpoint} 连续失败 {stats['consecutive_failures']} 次，熔断 {CIRCUIT_OPEN_SECONDS}s")
+
+    def _stats(self, url):
+        self._ensure_loaded()
+        return self.endpoints.get(_endpoint_key(url))
+
+    @staticmethod
+    def _admit(stats, now):
+        """
+        是否放行该接口的请求：熔断中不放行；熔断到期后（半开）只放行一次试探，
+        试探请求未留下结果（如被取消）时，CIRCUIT_OPEN_SECONDS 后可再试探
+        """
+        if not stats or not stats['circuit_open_until']:
+            return True
+        if stats['circuit_open_until'] > now:
+            return False
+        if now - stats.get('probe_started', 0) < CIRCUIT_OPEN_SECONDS:
+            return False
+        stats['probe_started'] = now
+        return True
+
+    def allow(self, url):
+        """请求前调用：熔断中返回 False；半开状态下第一次调用返回 True 作为试探"""
+        with self._lock:
+            return self._admit(self._stats(url), time.time())
+
+    def p90_latency(self, url):
+        """最近样本的 p90 延迟，样本不足时返回 None"""
+        with self._lock:
+            stats = self._stats(url)
+            samples = sorted(stats['latency_samples']) if stats else []
+        if len(samples) < 5:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * 0.9))]
+
+    def rank(self, sources):
+        """
+        按健康度重排数据源链：未熔断的健康源按 EWMA 延迟升序，不健康的排后；
+        熔断中的源被剔除（链可能为空，由调用方走估算/None 分支），半开的源只放行一次试探
+        """
+        with self._lock:
+            self._ensure_loaded()
+            now = time.time()
+            available = []
+            for source in sources:
+                stats = self.endpoints.get(_endpoint_key(source[1]))
+                if not self._admit(stats, now):
+                    continue
+                if stats is None:
+                    key = (0, float('inf'))
+                else:
+                    key = (int(stats['success_ewma'] < HEALTH_MIN_SUCCESS_RATE), stats['latency_ewma'])
+                available.append((key, source))
+        return [source for _, source in sorted(available, key=lambda item: item[0])]
+
+    def format_status(self):
+        """生成健康度状态表（--sources-status）"""
+        with self._lock:
+            self._ensure_loaded()
+            endpoints = dict(self.endpoints)
+        if not endpoints:
+            return "暂无数据源健康度记录"
+
+        now = time.time()
+        lines = [
+            f"{'接口':<40}{'EWMA延迟':>10}{'p90':>8}{'成功率':>8}{'请求':>6}{'失败':>6}{'连败':>6}  熔断",
+        ]
+        for endpoint, stats in sorted(endpoints.items()):
+            samples = sorted(stats['latency_samples'])
+            p90 = f"{samples[min(len(samples) - 1, int(len(samples) * 0.9))]:.2f}s" if samples else "-"
+            if stats['circuit_open_until'] > now:
+                circuit = f"打开（剩余 {stats['circuit_open_until'] - now:.0f}s）"
+            else:
+                circuit = "关闭"
+            lines.append(
+                f"{endpoint:<40}{stats['latency_ewma']:>9.2f}s{p90:>8}{stats['success_ewma']:>8.0%}"
+                f"{stats['requests']:>6}{stats['failures']:>6}{stats['consecutive_failures']:>6}  {circuit}"
+            )
+            if stats.get('last_error'):
+                lines.append(f"    最近错误：{stats['last_error']}")
+        return "\n".join(lines)
+
+
+SOURCE_HEALTH = SourceHealthRegistry(os.path.join(STATE_DIR, HEALTH_FILE))
+
+
+class RateLimitExceeded(Exception):
+    """
+    本地限流拒绝（令牌不足需等待过久、月度配额用尽或上游 429 冷却中）
+    请求未发出，不计入数据源健康度，调用方应改用下一个源
+    """
+
+
+class UpstreamRateLimited(Exception):
+    """上游返回 HTTP 429，计入数据源健康度失败"""
+
+
+class ProviderRateLimiter:
+    """
+    按服务商的令牌桶限流，状态存于 SQLite，供同一台机器上的多个进程共享
+
+    - 每分钟 callsPerMinute 个令牌，桶容量同为 callsPerMinute
+    - 每月 callsPerMonth 次配额，按 UTC 自然月计数
+    - 上游返回 429 时按 Retry-After 冻结该服务商，其他进程同样遵守
+    限额取自配置文件（CoinGecko 的 limits 以及 rateLimits 中按域名列出的服务商），
+    未配置的域名不限流
+    """
+
+    def __init__(self, path, limits):
+        self.path = path
+        self.limits = limits
+        self._initialized = False
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, path, config_file=CRYPTO_CONFIG_FILE):
+        limits = {}
+        try:
+            with open(config_file, 'r', encoding='utf-8') as f:
+                config = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"读取限流配置失败，不限流：{e}")
+            return cls(path, limits)
+        if config.get('baseUrl') and isinstance(config.get('limits'), dict):
+            limits[urlparse(config['baseUrl']).netloc] = config['limits']
+        limits.update(config.get('rateLimits', {}))
+        return cls(path, {
+            host: {
+                'per_minute': int(spec['callsPerMinute']) if isinstance(spec.get('callsPerMinute'), int) else None,
+                'per_month': int(spec['callsPerMonth']) if isinstance(spec.get('callsPerMonth'), int) else None,
+            }
+            for host, spec in limits.items()
+        })
+
+    def _connect(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        if not self._initialized:
+            with self._lock:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS buckets ("
+                    "host TEXT PRIMARY KEY, tokens REAL, updated REAL, "
+                    "month TEXT, month_calls INTEGER, blocked_until REAL)"
+                )
+                self._initialized = True
+        return conn
+
+    def _take(self, conn, host, limit):
+        """在一个写事务内尝试取令牌，返回需要等待的秒数（0 表示已取到）"""
+        now = time.time()
+        month = datetime.now(timezone.utc).strftime('%Y-%m')
+        per_minute = limit['per_minute']
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT tokens, updated, month, month_calls, blocked_until FROM buckets WHERE host = ?", (host,)
+            ).fetchone()
+            tokens, updated, row_month, month_calls, blocked_until = row or (per_minute or 0, now, month, 0, 0)
+            if row_month != month:
+                month_calls = 0
+            if limit['per_month'] is not None and month_calls >= limit['per_month']:
+                raise RateLimitExceeded(f"{host} 本月配额已用完（{month_calls}/{limit['per_month']}）")
+            if per_minute:
+                tokens = min(per_minute, tokens + (now - updated) * per_minute / 60)
+            if blocked_until > now:
+                wait_seconds = blocked_until - now
+            elif per_minute and tokens < 1:
+                wait_seconds = (1 - tokens) * 60 / per_minute
+            else:
+                wait_seconds = 0
+                tokens -= 1 if per_minute else 0
+                month_calls += 1
+            conn.execute(
+                "INSERT OR REPLACE INTO buckets VALUES (?, ?, ?, ?, ?, ?)",
+                (host, tokens, now, month, month_calls, blocked_until),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return wait_seconds
+
+    def acquire(self, url, deadline=None, max_wait=None):
+        """
+        请求前取一个令牌；令牌不足时短暂等待，等待超过 max_wait 或越过
+        deadline 则抛出 RateLimitExceeded
+        """
+        host = urlparse(url).netloc
+        limit = self.limits.get(host)
+        if limit is None:
+            return
+        max_wait = RATE_LIMIT_MAX_WAIT if max_wait is None else max_wait
+        waited = 0.0
+        conn = self._connect()
+        try:
+            while True:
+                wait_seconds = self._take(conn, host, limit)
+                if wait_seconds <= 0:
+                    return
+                if waited + wait_seconds > max_wait or (
+                        deadline is not None and time.monotonic() + wait_seconds > deadline):
+                    raise RateLimitExceeded(f"{host} 已达到限流，需等待 {wait_seconds:.1f}s")
+                time.sleep(wait_seconds)
+                waited += wait_seconds
+        finally:
+            conn.close()
+
+    def penalize(self, url, retry_after):
+        """上游返回 429：清空令牌并在 retry_after 秒内拒绝该服务商的请求"""
+        host = urlparse(url).netloc
+        if host not in self.limits:
+            return
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute(
+                "INSERT OR IGNORE INTO buckets VALUES (?, 0, ?, ?, 0, 0)",
+                (host, now, datetime.now(timezone.utc).strftime('%Y-%m')),
+            )
+            conn.execute(
+                "UPDATE buckets SET tokens = 0, updated = ?, blocked_until = MAX(blocked_until, ?) WHERE host = ?",
+                (now, now + retry_after, host),
+            )
+        finally:
+            conn.close()
+
+    def format_status(self):
+        """生成限流与配额使用情况（--sources-status）"""
+        if not self.limits:
+            return "未配置限流"
+        month = datetime.now(timezone.utc).strftime('%Y-%m')
+        rows = {}
+        if os.path.exists(self.path):
+            conn = self._connect()
+            try:
+                for host, tokens, updated, row_month, month_calls, blocked_until in conn.execute(
+                        "SELECT * FROM buckets"):
+                    rows[host] = (tokens, updated, month_calls if row_month == month else 0, blocked_until)
+            finally:
+                conn.close()
+        now = time.time()
+        lines = [f"{'服务商':<40}{'每分钟':>8}{'本月已用':>14}  状态"]
+        for host, limit in sorted(self.limits.items()):
+            tokens, updated, month_calls, blocked_until = rows.get(host, (limit['per_minute'] or 0, now, 0, 0))
+            per_minute = limit['per_minute']
+            if per_minute:
+                tokens = min(per_minute, tokens + (now - updated) * per_minute / 60)
+            quota = f"{month_calls}/{limit['per_month']}" if limit['per_month'] else str(month_calls)
+            state = f"429 冷却（剩余 {blocked_until - now:.0f}s）" if blocked_until > now else \
+                f"剩余令牌 {tokens:.1f}" if per_minute else "正常"
+            lines.append(f"{host:<40}{per_minute or '-':>8}{quota:>14}  {state}")
+        return "\n".join(lines)
+
+
+RATE_LIMITER = ProviderRateLimiter.from_config(os.path.join(STATE_DIR, RATE_LIMIT_FILE))
+
 # ==================== 数据获取函数 ====================
 
-def fetch_with_retry(url, timeout=10, retries=3):
-    """带重试的 HTTP 请求"""
-    headers = {
+# 本进程的请求计数（基准测试读取）：实际发出的请求、重试、被限流拒绝的次数
+FETCH_STATS = {'requests': 0, 'retries': 0, 'rate_limited': 0}
+_FETCH_STATS_LOCK = threading.Lock()
+
+
+def _count_fetch(key):
+    with _FETCH_STATS_LOCK:
+        FETCH_STATS[key] += 1
+
+
+def fetch_with_retry(url, timeout=10, retries=3, deadline=None, cancel_event=None, headers=None):
+    """
+    带重试的 HTTP 请求
+    deadline 为 time.monotonic() 时间点，给定时单次超时不会越过它
+    cancel_event 被置位后不再发起新的尝试（对冲请求中落败的一方）
+    headers 为附加请求头（如条件请求的 If-None-Match）
+    每次尝试前先向 RATE_LIMITER 取令牌，取不到时抛出 RateLimitExceeded；
+    上游返回 429 时记录冷却并抛出 UpstreamRateLimited，不再重试
+    """
+    headers = dict({
         'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36'
-    }
+    }, **(headers or {}))
 
     for i in range(retries):
+        if cancel_event is not None and cancel_event.is_set():
+            raise RequestAborted(f"请求已取消：{url}")
+        request_timeout = timeout
+        if deadline is not None:
+            request_timeout = min(timeout, deadline - time.monotonic())
+            if request_timeout <= 0:
+                raise RequestAborted(f"已超过报告截止时间：{url}")
+        if i > 0:
+            _count_fetch('retries')
         try:
-            response = requests.get(url, headers=headers, timeout=timeout, verify=True)
+            RATE_LIMITER.acquire(url, deadline)
+        except RateLimitExceeded:
+            _count_fetch('rate_limited')
+            raise
+        _count_fetch('requests')
+        try:
+            response = requests.get(url, headers=headers, timeout=request_timeout, verify=True)
+            if response.status_code == 429:
+                _count_fetch('rate_limited')
+                retry_after = response.headers.get('Retry-After', '')
+                retry_after = float(retry_after) if retry_after.isdigit() else RATE_LIMIT_DEFAULT_RETRY_AFTER
+                RATE_LIMITER.penalize(url, retry_after)
+                raise UpstreamRateLimited(f"上游限流（HTTP 429），{retry_after:.0f}s 后再试：{url}")
             response.raise_for_status()
             return response
+        except UpstreamRateLimited:
+            raise
         except Exception as e:
             if i < retries - 1:
                 time.sleep(0.5)
@@ -43,70 +563,201 @@ def fetch_with_retry(url, timeout=10, retries=3):
     return None
 
 
-def get_gold_silver_prices():
+def _parse_binance_metal(data):
+    """解析币安 24hr ticker（金属代币，单位 USD/盎司）"""
+    price = float(data.get('lastPrice', 0))
+    if price <= 0:
+        return None
+    return {
+        'price_usd_oz': price,
+        'change_pct': float(data.get('priceChangePercent', 0))
+    }
+
+
+def _parse_coingecko_silver(data):
+    """解析 CoinGecko Wrapped Silver 报价"""
+    wsilver = data.get('wrapped-silver', {})
+    if not wsilver or not wsilver.get('usd'):
+        return None
+    return {
+        'price_usd_oz': wsilver.get('usd', 0),
+        'change_pct': wsilver.get('usd_24h_change', 0)
+    }
+
+
+def _parse_coingecko_btc(data):
+    """解析 CoinGecko 比特币报价"""
+    btc = data.get('bitcoin', {})
+    if not btc or not btc.get('usd'):
+        return None
+    return {
+        'price_usd': btc.get('usd', 0),
+        'change_24h_pct': btc.get('usd_24h_change', 0),
+        'volume_24h': btc.get('usd_24h_vol', 0),
+        'market_cap': btc.get('usd_market_cap', 0)
+    }
+
+
+def _parse_binance_btc(data):
+    """解析币安 BTCUSDT 24hr ticker"""
+    price = float(data.get('lastPrice', 0))
+    if price <= 0:
+        return None
+    return {
+        'price_usd': price,
+        'change_24h_pct': float(data.get('priceChangePercent', 0)),
+        'volume_24h': float(data.get('quoteVolume', 0)),
+        'market_cap': 0
+    }
+
+
+def _parse_fx_table(data):
+    """解析汇率接口返回的完整美元汇率表（必须包含 CNY）"""
+    rates = data.get('rates') or {}
+    if not rates.get('CNY'):
+        return None
+    return rates
+
+
+# 数据源链：(名称, URL, 解析函数)，按顺序尝试，前一个失败才启用下一个
+GOLD_SOURCES = [
+    ("币安 PAXG/USDT", f"{BINANCE_API}/ticker/24hr?symbol=PAXGUSDT", _parse_binance_metal),
+]
+
+SILVER_SOURCES = [
+    # 尝试不同的白银相关交易对
+    ("币安", f"{BINANCE_API}/ticker/24hr?symbol=SILVERUSDT", _parse_binance_metal),  # 如果有的话
+    # 使用 CoinGecko 的白银相关代币
+    ("CoinGecko Wrapped Silver",
+     f"{COINGECKO_API}/simple/price?ids=wrapped-silver&vs_currencies=usd&include_24hr_change=true",
+     _parse_coingecko_silver),
+]
+
+BTC_SOURCES = [
+    ("CoinGecko",
+     f"{COINGECKO_API}/simple/price?ids=bitcoin&vs_currencies=usd&include_24hr_vol=true&include_24hr_change=true&include_market_cap=true",
+     _parse_coingecko_btc),
+    # 备用：从币安获取
+    ("币安 BTC/USDT", f"{BINANCE_API}/ticker/24hr?symbol=BTCUSDT", _parse_binance_btc),
+]
+
+FX_SOURCES = [
+    ("ExchangeRate-API", "https://api.exchangerate-api.com/v4/latest/USD", _parse_fx_table),
+    # 备用源
+    ("Open ER-API", "https://open.er-api.com/v6/latest/USD", _parse_fx_table),
+]
+
+
+def _fetch_one_source(url, parse, deadline=None, cancel_event=None):
     """
-    从币安获取黄金和白银价格
-    PAXG = Paxos Gold (1 PAXG = 1 盎司黄金)
+    请求单个数据源并解析，解析结果为 None 表示数据无效；结果计入健康度
+    （请求未发出的取消、超时与本地限流拒绝除外，上游 429 计为失败）
     """
-    gold_data = None
-    silver_data = None
-
-    # 获取黄金价格 (PAXG/USDT)
+    started = time.monotonic()
     try:
-        binance_url = f"{BINANCE_API}/ticker/24hr?symbol=PAXGUSDT"
-        response = fetch_with_retry(binance_url)
-        if response and response.ok:
-            data = response.json()
-            gold_data = {
-                'price_usd_oz': float(data.get('lastPrice', 0)),
-                'change_pct': float(data.get('priceChangePercent', 0))
-            }
-            print(f"黄金数据来自：币安 PAXG/USDT")
+        response = fetch_with_retry(url, deadline=deadline, cancel_event=cancel_event)
+        data = parse(response.json()) if response and response.ok else None
+    except (RequestAborted, RateLimitExceeded):
+        raise
     except Exception as e:
-        print(f"币安黄金 API 失败：{e}")
+        SOURCE_HEALTH.record(url, False, time.monotonic() - started, e)
+        raise
+    SOURCE_HEALTH.record(url, data is not None, time.monotonic() - started,
+                         None if data is not None else "数据校验失败")
+    return data
 
-    # 获取白银价格 - 尝试多个来源
-    # 源 1: 币安 (如果有白银期货或代币)
-    # 源 2: 从其他加密货币交易所获取白银代币
-    # 源 3: 使用金银比估算（最后手段）
-
-    silver_sources = [
-        # 尝试不同的白银相关交易对
-        ("币安", f"{BINANCE_API}/ticker/24hr?symbol=SILVERUSDT"),  # 如果有的话
-    ]
 
-    for source_name, url in silver_sources:
-        try:
-            response = fetch_with_retry(url)
-            if response and response.ok:
-                data = response.json()
-                silver_data = {
-                    'price_usd_oz': float(data.get('lastPrice', 0)),
-                    'change_pct': float(data.get('priceChangePercent', 0))
-                }
-                print(f"白银数据来自：{source_name}")
-                break
-        except:
-            continue
-
-    # 如果还是没有白银数据，使用 CoinGecko 的白银相关代币
-    if not silver_data:
+def fetch_from_sources(sources, label, deadline=None):
+    """
+    按健康度排序后依次尝试数据源链，返回 (数据, 来源名称)
+    全部失败时返回 (None, None)
+    """
+    for source_name, url, parse in SOURCE_HEALTH.rank(sources):
         try:
-            # 使用 CoinGecko 获取白银价格
-            url = f"{COINGECKO_API}/simple/price?ids=wrapped-silver&vs_currencies=usd&include_24hr_change=true"
-            response = fetch_with_retry(url)
-            if response and response.ok:
-                data = response.json()
-                wsilver = data.get('wrapped-silver', {})
-                if wsilver:
-                    silver_data = {
-                        'price_usd_oz': wsilver.get('usd', 0),
-                        'change_pct': wsilver.get('usd_24h_change', 0)
-                    }
-                    print(f"白银数据来自：CoinGecko Wrapped Silver")
+            data = _fetch_one_source(url, parse, deadline)
+            if data is not None:
+                print(f"{label}数据来自：{source_name}")
+                return data, source_name
         except Exception as e:
-            print(f"CoinGecko 白银 API 失败：{e}")
+            print(f"{source_name} {label} API 失败：{e}")
+    return None, None
+
+
+def fetch_hedged(sources, label, deadline=None, hedge_delay=None):
+    """
+    对冲请求：返回 (数据, 来源名称)
 
+    数据源先按健康度排序，再请求第一个；若 hedge_delay 秒内没有有效结果，
+    或当前源已失败，立即启动下一个源。第一个通过校验的结果胜出，其余请求
+    被取消。hedge_delay 为 None 时取首选源的 p90 延迟（无记录时用 HEDGE_DELAY）。
+    """
+    if deadline is None:
+        deadline = time.monotonic() + REPORT_DEADLINE
+
+    sources = SOURCE_HEALTH.rank(sources)
+    if not sources:
+        return None, None
+    if hedge_delay is None:
+        hedge_delay = SOURCE_HEALTH.p90_latency(sources[0][1]) or HEDGE_DELAY
+
+    cancel_event = threading.Event()
+    pool = ThreadPoolExecutor(max_workers=len(sources))
+    pending = {}
+    next_index = 0
+    last_launch = 0.0
+
+    def launch():
+        nonlocal next_index, last_launch
+        source_name, url, parse = sources[next_index]
+        next_index += 1
+        last_launch = time.monotonic()
+        pending[pool.submit(_fetch_one_source, url, parse, deadline, cancel_event)] = source_name
+
+    try:
+        launch()
+        while pending:
+            now = time.monotonic()
+            remaining = deadline - now
+            if remaining <= 0:
+                break
+
+            timeout = remaining
+            if next_index < len(sources):
+                timeout = min(remaining, max(0, last_launch + hedge_delay - now))
+
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                # 主源迟迟不返回，启动对冲请求
+                if next_index < len(sources):
+                    print(f"{label}：{pending[next(iter(pending))]} 超过 {hedge_delay:.2f}s 未返回，"
+                          f"启动对冲源 {sources[next_index][0]}")
+                    launch()
+                continue
+
+            for future in done:
+                source_name = pending.pop(future)
+                try:
+                    data = future.result()
+                except Exception as e:
+                    print(f"{source_name} {label} API 失败：{e}")
+                    data = None
+                if data is not None:
+                    print(f"{label}数据来自：{source_name}")
+                    return data, source_name
+
+            # 已完成的源均无效，立即启用下一个源
+            if next_index < len(sources):
+                launch()
+
+        return None, None
+    finally:
+        # 取消落败或超时的请求
+        cancel_event.set()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _fill_metal_fallbacks(gold_data, silver_data):
+    """黄金/白银数据缺失时的估算兜底"""
     # 最后手段：使用金银比估算
     if not silver_data and gold_data:
         # 当前金银比约 80-90:1，取中间值
@@ -141,68 +792,451 @@ def get_gold_silver_prices():
     }
 
 
+def get_gold_silver_prices():
+    """
+    从币安获取黄金和白银价格
+    PAXG = Paxos Gold (1 PAXG = 1 盎司黄金)
+    """
+    # 获取黄金价格 (PAXG/USDT)
+    gold_data, _ = fetch_from_sources(GOLD_SOURCES, "黄金")
+
+    # 获取白银价格 - 尝试多个来源
+    # 源 1: 币安 (如果有白银期货或代币)
+    # 源 2: CoinGecko 白银代币
+    # 源 3: 使用金银比估算（最后手段）
+    silver_data, _ = fetch_from_sources(SILVER_SOURCES, "白银")
+
+    return _fill_metal_fallbacks(gold_data, silver_data)
+
+
 def get_bitcoin_price():
     """
-    从 CoinGecko 获取比特币价格
+    从 CoinGecko 获取比特币价格，失败时使用币安
     """
+    btc_data, _ = fetch_from_sources(BTC_SOURCES, "比特币")
+    return btc_data
+
+
+def get_usd_to_cny_rate():
+    """
+    获取美元兑人民币汇率
+    """
+    return FX_CACHE.get_quote()['rate']
+
+
+# ==================== 汇率缓存 ====================
+
+def _format_age(seconds):
+    """把秒数格式化为“N 分钟前”之类的描述"""
+    if seconds < 60:
+        return "刚刚"
+    if seconds < 3600:
+        return f"{int(seconds // 60)} 分钟前"
+    if seconds < 86400:
+        return f"{seconds / 3600:.1f} 小时前"
+    return f"{seconds / 86400:.1f} 天前"
+
+
+class FxRateCache:
+    """
+    持久化的美元汇率表缓存（STATE_DIR/fx-cache.json）
+
+    - 未过期（FX_CACHE_TTL 秒内）：直接返回缓存，不发请求
+    - 已过期：立即返回旧值，同时在后台线程刷新（stale-while-revalidate）
+    - 无缓存：同步请求；全部失败时返回默认值并明确标记为 fallback
+    刷新时对同一接口带上 If-None-Match / If-Modified-Since，收到 304 只更新时间。
+    """
+
+    def __init__(self, path, ttl=None):
+        self.path = path
+        self.ttl = ttl
+        self.entry = None
+        self._loaded = False
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._refresh_thread = None
+
+    def _load(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.entry = json.load(f)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"读取汇率缓存失败：{e}")
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.entry, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def refresh(self, deadline=None):
+        """按健康度顺序请求汇率接口并更新缓存，返回新的缓存条目或 None"""
+        with self._refresh_lock:
+            self._load()
+            for source_name, url, parse in SOURCE_HEALTH.rank(FX_SOURCES):
+                headers = {}
+                with self._lock:
+                    cached = dict(self.entry) if self.entry else None
+                if cached and cached.get('url') == url:
+                    if cached.get('etag'):
+                        headers['If-None-Match'] = cached['etag']
+                    if cached.get('last_modified'):
+                        headers['If-Modified-Since'] = cached['last_modified']
+
+                started = time.monotonic()
+                try:
+                    response = fetch_with_retry(url, deadline=deadline, headers=headers)
+                    if response.status_code == 304 and cached:
+                        entry = dict(cached, fetched_at=time.time())
+                        print(f"汇率未变化（304）：{source_name}")
+                    else:
+                        rates = parse(response.json())
+                        if rates is None:
+                            raise ValueError("汇率表缺少 CNY")
+                        entry = {
+                            'rates': rates,
+                            'source': source_name,
+                            'url': url,
+                            'etag': response.headers.get('ETag'),
+                            'last_modified': response.headers.get('Last-Modified'),
+                            'fetched_at': time.time(),
+                        }
+                        print(f"汇率数据来自：{source_name}")
+                except RequestAborted:
+                    # 已超过截止时间，后续源同样来不及
+                    break
+                except RateLimitExceeded as e:
+                    print(f"{source_name} 汇率 API 跳过：{e}")
+                    continue
+                except Exception as e:
+                    SOURCE_HEALTH.record(url, False, time.monotonic() - started, e)
+                    print(f"{source_name} 汇率 API 失败：{e}")
+                    continue
+
+                SOURCE_HEALTH.record(url, True, time.monotonic() - started)
+                with self._lock:
+                    self.entry = entry
+                    self._save()
+                return entry
+        return None
+
+    def _quote(self, entry, stale):
+        age = time.time() - entry['fetched_at']
+        return {
+            'rate': entry['rates']['CNY'],
+            'rates': entry['rates'],
+            'source': entry['source'],
+            'fetched_at': entry['fetched_at'],
+            'age': age,
+            'stale': stale,
+            'fallback': False,
+        }
+
+    def get_quote(self, deadline=None):
+        """返回汇率报价 dict：rate、rates（完整汇率表）、source、age、stale、fallback"""
+        ttl = self.ttl if self.ttl is not None else FX_CACHE_TTL
+        with self._lock:
+            self._load()
+            entry = self.entry
+
+        if entry and time.time() - entry['fetched_at'] < ttl:
+            return self._quote(entry, stale=False)
+
+        if entry:
+            # 先用旧值，后台刷新供下次使用
+            if not (self._refresh_thread and self._refresh_thread.is_alive()):
+                refresh_deadline = time.monotonic() + FX_REFRESH_DEADLINE
+                self._refresh_thread = threading.Thread(target=self.refresh, args=(refresh_deadline,))
+                self._refresh_thread.start()
+            return self._quote(entry, stale=True)
+
+        entry = self.refresh(deadline)
+        if entry:
+            return self._quote(entry, stale=False)
+        return fallback_fx_quote()
+
+    def wait_for_refresh(self, timeout=None):
+        """等待后台刷新结束（单次运行的脚本退出前调用）"""
+        if self._refresh_thread:
+            self._refresh_thread.join(timeout)
+
+
+FX_CACHE = FxRateCache(os.path.join(STATE_DIR, "fx-cache.json"))
+
+
+def fallback_fx_quote():
+    """汇率完全不可用时的默认报价"""
+    return {
+        'rate': FX_DEFAULT_USD_CNY,
+        'rates': {'USD': 1.0, 'CNY': FX_DEFAULT_USD_CNY},
+        'source': f"默认值 {FX_DEFAULT_USD_CNY}",
+        'fetched_at': None,
+        'age': None,
+        'stale': True,
+        'fallback': True,
+    }
+
+
+def describe_fx_quote(quote):
+    """报告中汇率后的说明：来源与数据年龄，默认值明确标出"""
+    if quote.get('fallback'):
+        return "⚠️ 默认值，非实时"
+    note = f"{quote['source']} · {_format_age(quote['age'])}更新"
+    if quote.get('stale'):
+        note += "（已过期，后台刷新中）"
+    return note
+
+
+# ==================== 自选资产批量采集 ====================
+
+def load_watchlist():
+    """
+    从 gold-price-config.json / crypto-api-config.json 读取自选资产
+
+    返回资产列表，每项包含 id、名称以及各数据源上的标识：
+    binance（交易对）、coingecko（币种 id）、gold_api（金属代码）
+    """
+    assets = []
     try:
-        url = f"{COINGECKO_API}/simple/price?ids=bitcoin&vs_currencies=usd&include_24hr_vol=true&include_24hr_change=true&include_market_cap=true"
-        response = fetch_with_retry(url)
-        if response and response.ok:
-            data = response.json()
-            btc = data.get('bitcoin', {})
-
-            return {
-                'price_usd': btc.get('usd', 0),
-                'change_24h_pct': btc.get('usd_24h_change', 0),
-                'volume_24h': btc.get('usd_24h_vol', 0),
-                'market_cap': btc.get('usd_market_cap', 0)
-            }
+        with open(GOLD_CONFIG_FILE, 'r', encoding='utf-8') as f:
+            gold_config = json.load(f)
+        binance_proxies = gold_config.get('binanceProxies', {})
+        coingecko_proxies = gold_config.get('coingeckoProxies', {})
+        for code, name in gold_config.get('symbols', {}).items():
+            assets.append({
+                'id': code,
+                'symbol': code,
+                'name': name,
+                'kind': 'metal',
+                'binance': binance_proxies.get(code),
+                'coingecko': coingecko_proxies.get(code),
+                'gold_api': code,
+                'gold_api_base': gold_config.get('baseUrl'),
+            })
     except Exception as e:
-        print(f"CoinGecko API 失败：{e}")
+        print(f"读取贵金属配置失败：{e}")
 
-    # 备用：从币安获取
     try:
-        binance_url = f"{BINANCE_API}/ticker/24hr?symbol=BTCUSDT"
-        response = fetch_with_retry(binance_url)
-        if response and response.ok:
-            data = response.json()
-            return {
-                'price_usd': float(data.get('lastPrice', 0)),
-                'change_24h_pct': float(data.get('priceChangePercent', 0)),
-                'volume_24h': float(data.get('quoteVolume', 0)),
-                'market_cap': 0
-            }
+        with open(CRYPTO_CONFIG_FILE, 'r', encoding='utf-8') as f:
+            crypto_config = json.load(f)
+        for coin_id, info in crypto_config.get('watchlist', {}).items():
+            assets.append({
+                'id': coin_id,
+                'symbol': info.get('symbol', coin_id.upper()),
+                'name': info.get('name', coin_id),
+                'kind': 'crypto',
+                'binance': info.get('binanceSymbol'),
+                'coingecko': coin_id,
+                'gold_api': None,
+            })
     except Exception as e:
-        print(f"币安 BTC API 失败：{e}")
+        print(f"读取加密货币配置失败：{e}")
 
-    return None
+    return assets
 
 
-def get_usd_to_cny_rate():
+def _parse_binance_batch(data):
+    """币安批量 ticker：列表 → {交易对: 行情}"""
+    if not isinstance(data, list):
+        return None
+    return {
+        item['symbol']: {
+            'price_usd': float(item.get('lastPrice', 0)),
+            'change_pct': float(item.get('priceChangePercent', 0)),
+            'volume_24h': float(item.get('quoteVolume', 0)),
+        }
+        for item in data if float(item.get('lastPrice', 0)) > 0
+    }
+
+
+def _parse_coingecko_batch(data):
+    """CoinGecko simple/price 批量结果 → {币种 id: 行情}"""
+    if not isinstance(data, dict):
+        return None
+    return {
+        coin_id: {
+            'price_usd': quote.get('usd', 0),
+            'change_pct': quote.get('usd_24h_change'),
+            'volume_24h': quote.get('usd_24h_vol', 0),
+            'market_cap': quote.get('usd_market_cap', 0),
+        }
+        for coin_id, quote in data.items() if quote.get('usd')
+    }
+
+
+def _parse_gold_api(data):
+    """gold-api.com 单个金属报价（无涨跌幅）"""
+    if not data.get('price'):
+        return None
+    return {'price_usd': float(data['price']), 'change_pct': None}
+
+
+def fetch_watchlist(assets=None, deadline=None):
     """
-    获取美元兑人民币汇率
+    批量获取自选资产行情，返回 {资产 id: 行情记录}
+
+    所有加密货币与有代币映射的金属合并成一次 CoinGecko simple/price 请求
+    和一次币安 ticker/24hr?symbols=[...] 请求；只有两者都覆盖不到的金属
+    才单独请求 gold-api.com。全部请求同时发出，再按资产拆分：
+    金属优先币安，加密货币优先 CoinGecko（带市值），其余作为回退。
     """
+    if assets is None:
+        assets = load_watchlist()
+    if not assets:
+        return {}
+    if deadline is None:
+        deadline = time.monotonic() + REPORT_DEADLINE
+
+    binance_symbols = sorted({a['binance'] for a in assets if a['binance']})
+    coingecko_ids = sorted({a['coingecko'] for a in assets if a['coingecko']})
+    gold_api_codes = [a for a in assets if a['gold_api'] and not a['binance'] and not a['coingecko']]
+
+    requests_to_send = {}
+    if binance_symbols:
+        symbols_param = quote(json.dumps(binance_symbols, separators=(',', ':')))
+        requests_to_send['binance'] = (f"{BINANCE_API}/ticker/24hr?symbols={symbols_param}", _parse_binance_batch)
+    if coingecko_ids:
+        requests_to_send['coingecko'] = (
+            f"{COINGECKO_API}/simple/price?ids={','.join(coingecko_ids)}&vs_currencies=usd"
+            f"&include_24hr_change=true&include_24hr_vol=true&include_market_cap=true",
+            _parse_coingecko_batch)
+    for asset in gold_api_codes:
+        requests_to_send[f"gold_api:{asset['id']}"] = (
+            f"{asset['gold_api_base']}/{asset['gold_api']}", _parse_gold_api)
+
+    pool = ThreadPoolExecutor(max_workers=len(requests_to_send))
+    futures = {
+        pool.submit(_fetch_one_source, url, parse, deadline): key
+        for key, (url, parse) in requests_to_send.items()
+        if SOURCE_HEALTH.allow(url)
+    }
+    done, _ = wait(futures, timeout=max(0, deadline - time.monotonic()))
+    pool.shutdown(wait=False, cancel_futures=True)
+
+    batches = {}
+    for future in done:
+        try:
+            batches[futures[future]] = future.result() or {}
+        except Exception as e:
+            print(f"自选资产 {futures[future]} 请求失败：{e}")
+
+    records = {}
+    for asset in assets:
+        candidates = [
+            ('币安', batches.get('binance', {}).get(asset['binance'])),
+            ('CoinGecko', batches.get('coingecko', {}).get(asset['coingecko'])),
+            ('Gold API', batches.get(f"gold_api:{asset['id']}")),
+        ]
+        if asset['kind'] == 'crypto':
+            candidates[0], candidates[1] = candidates[1], candidates[0]
+        for source_name, quote_data in candidates:
+            if quote_data:
+                records[asset['id']] = dict(quote_data, id=asset['id'], symbol=asset['symbol'],
+                                            name=asset['name'], kind=asset['kind'], source=source_name)
+                break
+
+    print(f"自选资产：{len(records)}/{len(assets)} 项，共 {len(futures)} 次请求")
+    return records
+
+
+def format_watchlist_markdown(watchlist, skip=('XAU', 'XAG', 'bitcoin')):
+    """自选资产表格（主报告已展示的资产跳过）"""
+    rows = []
+    for record in watchlist.values():
+        if record['id'] in skip:
+            continue
+        change = f"{record['change_pct']:+.2f}%" if record.get('change_pct') is not None else "-"
+        unit = " /盎司" if record['kind'] == 'metal' else ""
+        rows.append(f"| {record['name']} ({record['symbol']}) | ${record['price_usd']:,.2f}{unit} | {change} | {record['source']} |")
+    if not rows:
+        return ""
+    return "### 📋 自选资产\n| 资产 | 价格 | 24h 涨跌幅 | 来源 |\n|------|------|------|------|\n" + "\n".join(rows) + "\n\n---\n\n"
+
+
+# ==================== 并发数据采集 ====================
+
+def acquire_market_data(deadline_seconds=REPORT_DEADLINE, hedge=HEDGE_ENABLED,
+                        hedge_delay=None, watchlist=True):
+    """
+    并发获取全部行情数据
+
+    黄金、白银、比特币、汇率四条数据源链同时启动，每条链内部仍按顺序
+    回退（hedge=True 时主源超过 hedge_delay 秒未返回即同时启动备用源，
+    hedge_delay 为 None 时按各链首选源的 p90 延迟自动设定）；
+    整个采集过程共用一个截止时间，超时未完成的链按失败处理。
+    自选资产（watchlist=True）作为第五个任务，以批量请求同时获取。
+
+    返回 dict：precious_metals / bitcoin / usd_to_cny / sources（各项数据的
+    胜出来源）/ watchlist（自选资产记录）
+    """
+    deadline = time.monotonic() + deadline_seconds
+    chains = {
+        'gold': (GOLD_SOURCES, "黄金"),
+        'silver': (SILVER_SOURCES, "白银"),
+        'bitcoin': (BTC_SOURCES, "比特币"),
+    }
+
+    pool = ThreadPoolExecutor(max_workers=len(chains) + 1)
+    if hedge:
+        futures = {
+            pool.submit(fetch_hedged, sources, label, deadline, hedge_delay): key
+            for key, (sources, label) in chains.items()
+        }
+    else:
+        futures = {
+            pool.submit(fetch_from_sources, sources, label, deadline): key
+            for key, (sources, label) in chains.items()
+        }
+    # 汇率走缓存：未过期时不发请求
+    futures[pool.submit(lambda: (FX_CACHE.get_quote(deadline), None))] = 'fx_quote'
+    if watchlist:
+        futures[pool.submit(lambda: (fetch_watchlist(deadline=deadline), None))] = 'watchlist'
+    done, not_done = wait(futures, timeout=max(0, deadline - time.monotonic()))
+    # 不等待超时的线程，单次请求超时已被截止时间约束
+    pool.shutdown(wait=False, cancel_futures=True)
+
+    results = {}
+    sources = {}
+    for future in done:
+        try:
+            results[futures[future]], sources[futures[future]] = future.result()
+        except Exception as e:
+            print(f"{futures[future]} 采集失败：{e}")
+    for future in not_done:
+        print(f"{futures[future]} 采集超时（截止 {deadline_seconds}s），已跳过")
+
     try:
-        url = "https://api.exchangerate-api.com/v4/latest/USD"
-        response = fetch_with_retry(url)
-        if response and response.ok:
-            data = response.json()
-            return data['rates'].get('CNY', 7.25)
+        SOURCE_HEALTH.save()
     except Exception as e:
-        print(f"获取汇率失败：{e}")
+        print(f"保存数据源健康度失败：{e}")
 
-    # 备用源
-    try:
-        url = "https://open.er-api.com/v6/latest/USD"
-        response = fetch_with_retry(url)
-        if response and response.ok:
-            data = response.json()
-            return data['rates'].get('CNY', 7.25)
-    except:
-        pass
+    precious_metals = _fill_metal_fallbacks(results.get('gold'), results.get('silver'))
+    bitcoin = results.get('bitcoin')
+    fx_quote = results.get('fx_quote')
+    if fx_quote is None:
+        fx_quote = fallback_fx_quote()
+    usd_to_cny = fx_quote['rate']
+    sources['fx'] = fx_quote['source']
+
+    if not sources.get('gold'):
+        sources['gold'] = "备用估算"
+    if not sources.get('silver'):
+        sources['silver'] = "估算 (金银比 85:1)" if results.get('gold') else "备用估算"
 
-    return 7.25
+    return {
+        'precious_metals': precious_metals,
+        'bitcoin': bitcoin,
+        'usd_to_cny': usd_to_cny,
+        'fx_quote': fx_quote,
+        'sources': sources,
+        'watchlist': results.get('watchlist') or {},
+    }
 
 
 def calculate_domestic_price(price_usd_oz, usd_to_cny):
@@ -215,14 +1249,1056 @@ def calculate_domestic_price(price_usd_oz, usd_to_cny):
     return round(price_cny_gram, 2)
 
 
+class PriceMatrix:
+    """资产 × 币种 × 单位 的价格矩阵，get() 按名称取任意单元格"""
+
+    def __init__(self, assets, currencies, units, values):
+        self.assets = list(assets)
+        self.currencies = list(currencies)
+        self.units = list(units)
+        self.values = values
+
+    def get(self, asset, currency, unit):
+        """取单元格，资产/币种/单位不存在或汇率缺失时返回 None"""
+        try:
+            value = self.values[self.assets.index(asset), self.currencies.index(currency), self.units.index(unit)]
+        except ValueError:
+            return None
+        return None if np.isnan(value) else float(value)
+
+    def format(self, asset, currency, unit):
+        """格式化单元格，例如 HK$25,431.20 /两"""
+        value = self.get(asset, currency, unit)
+        if value is None:
+            return "-"
+        return f"{CURRENCY_SYMBOLS.get(currency, currency + ' ')}{value:,.2f} /{UNIT_NAMES.get(unit, unit)}"
+
+
+def build_price_matrix(prices_usd_oz, rates, currencies=PRICE_CURRENCIES, units=PRICE_UNITS):
+    """
+    把各资产的 USD/盎司 价格一次性换算成全部币种与单位
+
+    prices_usd_oz 为 {资产: USD/盎司}，rates 为美元汇率表（FX 缓存中的完整表）。
+    价格向量 (A,)、汇率向量 (C,)、单位折合盎司数 (U,) 广播相乘得到 (A, C, U)
+    """
+    assets = list(prices_usd_oz)
+    prices = np.array([prices_usd_oz[a] for a in assets], dtype=np.float64)
+    fx = np.array([1.0 if c == 'USD' else rates.get(c, np.nan) for c in currencies], dtype=np.float64)
+    ounces = np.array([units[u] for u in units], dtype=np.float64)
+    values = prices[:, None, None] * fx[None, :, None] * ounces[None, None, :]
+    return PriceMatrix(assets, currencies, list(units), values)
+
+
+def format_local_prices_markdown(matrix, cells=REPORT_LOCAL_PRICES):
+    """报告中“多币种价格”表格，展示 cells 中选定的单元格"""
+    rows = []
+    for asset, currency, unit in cells:
+        value = matrix.format(asset, currency, unit)
+        if value != "-":
+            rows.append(f"| {ASSET_NAMES.get(asset, asset)} | {currency} | **{value}** |")
+    if not rows:
+        return ""
+    return "### 🌏 多币种价格\n| 资产 | 币种 | 价格 |\n|------|------|------|\n" + "\n".join(rows) + "\n\n---\n\n"
+
+
+# ==================== 行情时间序列存储 ====================
+
+class TickStore:
+    """
+    只追加的行情时间序列存储
+
+    每个资产一个二进制文件（ticks/<资产 id>.bin），记录为定长 16 字节：
+    时间戳（uint32 秒）、价格（float64）、24h 涨跌幅（float32）。
+    记录按时间递增写入，时间戳列本身即索引：范围查询用 np.searchsorted
+    二分定位，再对 np.memmap 切片，不需要解析任何 JSON。
+    每资产每年约 52 万条分钟级样本 ≈ 8MB。
+    写入时对数据文件加排他锁（flock），--stream 与定时任务可以同时追加。
+    """
+
+    DTYPE = np.dtype([('ts', '<u4'), ('price', '<f8'), ('change', '<f4')])
+
+    def __init__(self, root):
+        self.root = root
+        self._lock = threading.Lock()
+
+    def _path(self, asset):
+        return os.path.join(self.root, f"{asset}.bin")
+
+    def assets(self):
+        """已有数据的资产 id 列表"""
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(name[:-4] for name in os.listdir(self.root) if name.endswith('.bin'))
+
+    def _tail_timestamp(self, f, size):
+        """文件中最后一条完整记录的时间戳，无记录时返回 None"""
+        count = size // self.DTYPE.itemsize
+        if count == 0:
+            return None
+        f.seek((count - 1) * self.DTYPE.itemsize)
+        return int(np.frombuffer(f.read(self.DTYPE.itemsize), self.DTYPE)['ts'][0])
+
+    def last_timestamp(self, asset):
+        """最后一条记录的时间戳，无记录时返回 None（每次读文件尾，其他进程的写入立即可见）"""
+        path = self._path(asset)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'rb') as f:
+            return self._tail_timestamp(f, os.fstat(f.fileno()).st_size)
+
+    def append(self, asset, price, change=0.0, ts=None):
+        """追加一条记录；时间戳不晚于已有最后一条时跳过，返回是否写入"""
+        ts = int(ts if ts is not None else time.time())
+        return self.append_many(asset, [ts], [price], [change if change is not None else 0.0]) > 0
+
+    def append_many(self, asset, timestamps, prices, changes=None):
+        """
+        批量追加（时间戳需递增），不晚于已有最后一条的记录被丢弃，返回写入条数
+
+        在文件锁内截掉半写入的尾部记录并重新读取最后一条的时间戳，
+        保证多个进程交替追加时记录仍对齐且时间戳递增
+        """
+        records = np.zeros(len(timestamps), dtype=self.DTYPE)
+        records['ts'] = timestamps
+        records['price'] = prices
+        records['change'] = changes if changes is not None else 0.0
+
+        os.makedirs(self.root, exist_ok=True)
+        with self._lock, open(self._path(asset), 'a+b') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                size = os.fstat(f.fileno()).st_size
+                if size % self.DTYPE.itemsize:
+                    f.truncate(size - size % self.DTYPE.itemsize)
+                last_ts = self._tail_timestamp(f, size)
+                if last_ts is not None:
+                    records = records[records['ts'] > last_ts]
+                if len(records) == 0:
+                    return 0
+                f.write(records.tobytes())
+                f.flush()
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+        return len(records)
+
+    def read(self, asset, start=None, end=None):
+        """
+        读取 [start, end) 时间范围（秒级时间戳）内的记录
+
+        返回结构化数组（字段 ts / price / change），是对内存映射文件的切片
+        """
+        path = self._path(asset)
+        if not os.path.exists(path) or os.path.getsize(path) < self.DTYPE.itemsize:
+            return np.zeros(0, dtype=self.DTYPE)
+        count = os.path.getsize(path) // self.DTYPE.itemsize
+        data = np.memmap(path, dtype=self.DTYPE, mode='r', shape=(count,))
+        ts = data['ts']
+        lo = 0 if start is None else int(np.searchsorted(ts, int(start), side='left'))
+        hi = count if end is None else int(np.searchsorted(ts, int(end), side='left'))
+        return data[lo:hi]
+
+
+TICK_STORE = TickStore(os.path.join(STATE_DIR, "ticks"))
+
+
+def record_market_snapshot(market, ts=None):
+    """把一次采集结果写入时间序列（估算值不入库）"""
+    ts = int(ts if ts is not None else time.time())
+    sources = market.get('sources', {})
+    precious_metals = market.get('precious_metals') or {}
+    samples = []
+    for asset, key in (('XAU', 'gold'), ('XAG', 'silver')):
+        data = precious_metals.get(key)
+        if data and "估算" not in sources.get(key, ""):
+            samples.append((asset, data['price_usd_oz'], data['change_pct']))
+    bitcoin = market.get('bitcoin')
+    if bitcoin:
+        samples.append(('bitcoin', bitcoin['price_usd'], bitcoin['change_24h_pct']))
+    recorded = {asset for asset, _, _ in samples}
+    for record in (market.get('watchlist') or {}).values():
+        if record['id'] not in recorded:
+            samples.append((record['id'], record['price_usd'], record.get('change_pct')))
+
+    written = 0
+    for asset, price, change in samples:
+        try:
+            written += TICK_STORE.append(asset, price, change, ts)
+        except Exception as e:
+            print(f"写入 {asset} 时间序列失败：{e}")
+    return written
+
+
+# ==================== 历史 K 线回补 ====================
+
+KLINE_COLUMNS = (
+    ('open_time', '<i8'),
+    ('open', '<f8'),
+    ('high', '<f8'),
+    ('low', '<f8'),
+    ('close', '<f8'),
+    ('volume', '<f8'),
+)
+
+KLINE_INTERVAL_MS = {'1m': 60_000, '5m': 300_000, '15m': 900_000, '1h': 3_600_000, '4h': 14_400_000, '1d': 86_400_000}
+
+
+class KlineStore:
+    """
+    币安 K 线的列式存储：klines/<交易对>_<周期>/<列名>.bin，每列一个定长数组文件
+
+    追加时逐列写入；若上次写入中断导致各列长度不一致，打开时截断到最短列，
+    因此总能从最后一根完整 K 线续传
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def _dir(self, symbol, interval):
+        return os.path.join(self.root, f"{symbol.upper()}_{interval}")
+
+    def _column_path(self, symbol, interval, column):
+        return os.path.join(self._dir(symbol, interval), f"{column}.bin")
+
+    def count(self, symbol, interval):
+        """完整 K 线数量（各列长度的最小值），并截断多余的半写入数据"""
+        lengths = {}
+        for column, dtype in KLINE_COLUMNS:
+            path = self._column_path(symbol, interval, column)
+            size = os.path.getsize(path) if os.path.exists(path) else 0
+            lengths[column] = (size // np.dtype(dtype).itemsize, np.dtype(dtype).itemsize)
+        n = min(length for length, _ in lengths.values())
+        for column, (length, itemsize) in lengths.items():
+            if length > n:
+                with open(self._column_path(symbol, interval, column), 'r+b') as f:
+                    f.truncate(n * itemsize)
+        return n
+
+    def last_open_time(self, symbol, interval):
+        """最后一根 K 线的开盘时间（毫秒），无数据时返回 None"""
+        n = self.count(symbol, interval)
+        if n == 0:
+            return None
+        with open(self._column_path(symbol, interval, 'open_time'), 'rb') as f:
+            f.seek((n - 1) * 8)
+            return int(np.frombuffer(f.read(8), '<i8')[0])
+
+    def append(self, symbol, interval, rows):
+        """追加币安 klines 接口返回的原始行，返回写入条数"""
+        if not rows:
+            return 0
+        os.makedirs(self._dir(symbol, interval), exist_ok=True)
+        raw = np.array([row[:6] for row in rows], dtype=object)
+        for index, (column, dtype) in enumerate(KLINE_COLUMNS):
+            with open(self._column_path(symbol, interval, column), 'ab') as f:
+                f.write(raw[:, index].astype(np.float64).astype(dtype).tobytes())
+        return len(rows)
+
+    def read(self, symbol, interval, columns=('open_time', 'close'), start_ms=None, end_ms=None):
+        """读取指定列（np.memmap），按开盘时间 [start_ms, end_ms) 二分截取"""
+        n = self.count(symbol, interval)
+        data = {}
+        for column, dtype in KLINE_COLUMNS:
+            if column in columns or column == 'open_time':
+                if n == 0:
+                    data[column] = np.zeros(0, dtype=dtype)
+                else:
+                    data[column] = np.memmap(self._column_path(symbol, interval, column), dtype=dtype,
+                                             mode='r', shape=(n,))
+        open_time = data['open_time']
+        lo = 0 if start_ms is None else int(np.searchsorted(open_time, start_ms, side='left'))
+        hi = n if end_ms is None else int(np.searchsorted(open_time, end_ms, side='left'))
+        return {column: data[column][lo:hi] for column in columns}
+
+
+KLINE_STORE = KlineStore(os.path.join(STATE_DIR, "klines"))
+
+
+class BinanceWeightGate:
+    """
+    币安请求权重闸门：按响应头 X-MBX-USED-WEIGHT-1M 跟踪已用权重，
+    接近 BACKFILL_WEIGHT_BUDGET 时暂停到下一分钟；429/418 时按 Retry-After 等待
+    """
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.used = 0
+        self.minute = int(time.time() // 60)
+        self._lock = threading.Lock()
+
+    def acquire(self, weight):
+        while True:
+            with self._lock:
+                minute = int(time.time() // 60)
+                if minute != self.minute:
+                    self.minute, self.used = minute, 0
+                if self.used + weight <= self.budget:
+                    self.used += weight
+                    return
+                wait_seconds = (self.minute + 1) * 60 - time.time()
+            print(f"币安权重已用 {self.used}/{self.budget}，等待 {wait_seconds:.0f}s")
+            time.sleep(max(wait_seconds, 0.1))
+
+    def update(self, response):
+        used = response.headers.get('X-MBX-USED-WEIGHT-1M')
+        if used is not None:
+            with self._lock:
+                self.used = max(self.used, int(used))
+
+    def backoff(self, response):
+        retry_after = float(response.headers.get('Retry-After', 60))
+        print(f"币安限流（HTTP {response.status_code}），等待 {retry_after:.0f}s")
+        time.sleep(retry_after)
+
+
+def _fetch_kline_window(session, gate, symbol, interval, start_ms, end_ms):
+    """请求一个分页窗口（最多 1000 根），限流时等待后重试"""
+    url = f"{BINANCE_API}/klines"
+    params = {'symbol': symbol, 'interval': interval, 'startTime': start_ms, 'endTime': end_ms - 1,
+              'limit': BACKFILL_PAGE_LIMIT}
+    for attempt in range(3):
+        gate.acquire(BACKFILL_REQUEST_WEIGHT)
+        try:
+            response = session.get(url, params=params, timeout=10)
+        except Exception:
+            if attempt == 2:
+                raise
+            time.sleep(0.5)
+            continue
+        gate.update(response)
+        if response.status_code in (418, 429):
+            gate.backoff(response)
+            continue
+        response.raise_for_status()
+        return response.json()
+    raise RuntimeError(f"K 线窗口请求失败：{symbol} {start_ms}")
+
+
+def backfill_klines(symbol, since, interval='1m', store=None, workers=BACKFILL_WORKERS, until=None):
+    """
+    回补币安 K 线到列式存储
+
+    从已存数据的最后一根（或 since）开始，把时间范围切成每页 1000 根的窗口，
+    由有界线程池并行请求；完成的窗口按时间顺序依次落盘，中断后重跑即从
+    最后一根完整 K 线续传。返回写入条数
+    """
+    store = store or KLINE_STORE
+    symbol = symbol.upper()
+    step = KLINE_INTERVAL_MS[interval]
+    last = store.last_open_time(symbol, interval)
+    start_ms = last + step if last is not None else int(since.timestamp() * 1000) // step * step
+    end_ms = int((until or time.time()) * 1000) // step * step
+    if start_ms >= end_ms:
+        print(f"{symbol} {interval} 已是最新")
+        return 0
+
+    page = step * BACKFILL_PAGE_LIMIT
+    windows = [(s, min(s + page, end_ms)) for s in range(start_ms, end_ms, page)]
+    print(f"回补 {symbol} {interval}：{datetime.fromtimestamp(start_ms / 1000, timezone.utc):%Y-%m-%d %H:%M} 起，"
+          f"{len(windows)} 个窗口，{workers} 个并发")
+
+    session = requests.Session()
+    gate = BinanceWeightGate(BACKFILL_WEIGHT_BUDGET)
+    written = 0
+    started = time.monotonic()
+    completed = {}
+    next_to_write = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = set()
+        submit_index = 0
+        while next_to_write < len(windows):
+            # 控制在途窗口数，避免领先落盘位置太多占用内存
+            while submit_index < len(windows) and len(pending) + len(completed) < workers * 4:
+                future = pool.submit(_fetch_kline_window, session, gate, symbol, interval, *windows[submit_index])
+                future.window_index = submit_index
+                pending.add(future)
+                submit_index += 1
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                completed[future.window_index] = future.result()
+            # 按顺序落盘已完成的连续窗口
+            while next_to_write in completed:
+                rows = completed.pop(next_to_write)
+                rows = [row for row in rows if row[0] < end_ms]
+                written += store.append(symbol, interval, rows)
+                next_to_write += 1
+            print(f"\r  进度 {next_to_write}/{len(windows)} 窗口，{written} 根 K 线", end="", flush=True)
+
+    print(f"\n✓ 回补完成：{written} 根，用时 {time.monotonic() - started:.1f}s")
+    return written
+
+
+def load_asset_history(asset, start, end, store=None, kline_store=None):
+    """
+    读取资产价格历史 (秒级时间戳数组, 价格数组)：
+    先取回补的 K 线收盘价，再接上其后的实时采样
+    """
+    store = store or TICK_STORE
+    kline_store = kline_store or KLINE_STORE
+    parts_ts, parts_price = [], []
+    history_end = start
+    symbol = KLINE_SYMBOLS.get(asset)
+    if symbol:
+        for interval in sorted(KLINE_INTERVAL_MS, key=KLINE_INTERVAL_MS.get):
+            # 只取收盘时刻不晚于 end 的 K 线：open_time + 周期 <= end（read 的上界不含）
+            klines = kline_store.read(symbol, interval, ('open_time', 'close'), start * 1000,
+                                      end * 1000 - KLINE_INTERVAL_MS[interval] + 1)
+            if len(klines['open_time']):
+                # 收盘价对应 K 线结束时刻
+                ts = klines['open_time'] // 1000 + KLINE_INTERVAL_MS[interval] // 1000
+                parts_ts.append(ts)
+                parts_price.append(np.asarray(klines['close']))
+                history_end = int(ts[-1])
+                break
+    records = store.read(asset, history_end + 1, end + 1) if parts_ts else store.read(asset, start, end + 1)
+    parts_ts.append(records['ts'].astype(np.int64))
+    parts_price.append(np.asarray(records['price']))
+    return np.concatenate(parts_ts), np.concatenate(parts_price)
+
+
+# ==================== 技术指标分析 ====================
+
+def _rolling_sum(matrix, window):
+    """沿时间轴（axis=1）的滚动和，前 window-1 个位置为 0"""
+    cumsum = np.cumsum(matrix, axis=1)
+    out = np.zeros(matrix.shape)
+    out[:, window - 1:] = cumsum[:, window - 1:]
+    out[:, window:] -= cumsum[:, :-window]
+    return out
+
+
+def _rolling_mean(matrix, window):
+    """沿时间轴（axis=1）的滚动均值，窗口内含 NaN 的位置为 NaN"""
+    valid = ~np.isnan(matrix)
+    total = _rolling_sum(np.where(valid, matrix, 0.0), window)
+    count = _rolling_sum(valid.astype(np.float64), window)
+    out = total / window
+    out[count < window] = np.nan
+    return out
+
+
+def _ema(matrix, span):
+    """
+    沿时间轴的 EMA（截断核）：权重 alpha*(1-alpha)^k 截断到 ANALYTICS_EMA_TRUNCATION*span 期，
+    用滑动窗口视图一次矩阵乘法完成，所有资产同时计算
+    """
+    alpha = 2.0 / (span + 1)
+    length = min(ANALYTICS_EMA_TRUNCATION * span, matrix.shape[1])
+    weights = alpha * (1 - alpha) ** np.arange(length)[::-1]
+    weights /= weights.sum()
+    out = np.full(matrix.shape, np.nan)
+    windows = np.lib.stride_tricks.sliding_window_view(matrix, length, axis=1)
+    out[:, length - 1:] = windows @ weights
+    return out
+
+
+def load_price_matrix(assets, start, end, bar_seconds=ANALYTICS_BAR_SECONDS, store=None, kline_store=None,
+                      return_observed=False):
+    """
+    把各资产的时间序列（回补 K 线 + 实时采样）重采样到统一的 bar 网格，
+    返回 (时间戳数组, 价格矩阵)
+
+    矩阵形状为 (资产数, bar 数)，每个 bar 取区间内最后一个价格并向前填充，
+    首个样本之前为 NaN。return_observed 为真时额外返回同形状的布尔矩阵，
+    标出区间内确有样本（而非向前填充）的 bar
+    """
+    n_bars = max(1, int((end - start) // bar_seconds) + 1)
+    matrix = np.full((len(assets), n_bars), np.nan)
+    for row, asset in enumerate(assets):
+        ts, prices = load_asset_history(asset, start, end, store, kline_store)
+        if len(ts) == 0:
+            continue
+        idx = (ts - start) // bar_seconds
+        in_range = (idx >= 0) & (idx < n_bars)
+        idx, prices = idx[in_range], prices[in_range]
+        if len(idx) == 0:
+            continue
+        is_last = np.r_[idx[1:] != idx[:-1], True]
+        matrix[row, idx[is_last]] = prices[is_last]
+
+    # 向前填充：每个位置取其之前最近一个有效值的下标
+    valid = ~np.isnan(matrix)
+    positions = np.where(valid, np.arange(n_bars), 0)
+    np.maximum.accumulate(positions, axis=1, out=positions)
+    filled = matrix[np.arange(len(assets))[:, None], positions]
+    filled[~np.maximum.accumulate(valid, axis=1)] = np.nan
+    timestamps = start + np.arange(n_bars) * bar_seconds
+    if return_observed:
+        return timestamps, filled, valid
+    return timestamps, filled
+
+
+def compute_signals(assets=ANALYTICS_ASSETS, now=None, store=None, kline_store=None):
+    """
+    对所有资产一次性计算技术指标，返回 {资产 id: 指标 dict}，另含 'ratio'（金银比）
+
+    指标：滚动波动率（及其历史中位数）、SMA/EMA 快慢线及最近的交叉、
+    当前回撤与最大回撤；金银比相对自身历史的 z 分数。
+    历史跨度不足最长的 EMA 核（ANALYTICS_EMA_TRUNCATION*ANALYTICS_SLOW_WINDOW 个 bar）、
+    或真实采样的 bar（不含向前填充）不足 ANALYTICS_SLOW_WINDOW 个的资产不输出指标；
+    快慢线仍为 NaN 时 trend 为 None（无信号）。
+    """
+    now = int(now if now is not None else time.time())
+    start = now - ANALYTICS_LOOKBACK_DAYS * 86400
+    _, prices, observed = load_price_matrix(list(assets), start, now, store=store, kline_store=kline_store,
+                                            return_observed=True)
+    history = (~np.isnan(prices)).sum(axis=1)
+    samples = observed.sum(axis=1)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        returns = np.full(prices.shape, np.nan)
+        returns[:, 1:] = np.diff(np.log(prices), axis=1)
+        window = ANALYTICS_VOL_WINDOW
+        mean_r = _rolling_mean(returns, window)
+        mean_r2 = _rolling_mean(returns ** 2, window)
+        volatility = np.sqrt(np.maximum(mean_r2 - mean_r ** 2, 0)) * np.sqrt(window) * 100
+
+        sma_fast = _rolling_mean(prices, ANALYTICS_FAST_WINDOW)
+        sma_slow = _rolling_mean(prices, ANALYTICS_SLOW_WINDOW)
+        ema_fast = _ema(prices, ANALYTICS_FAST_WINDOW)
+        ema_slow = _ema(prices, ANALYTICS_SLOW_WINDOW)
+
+        running_max = np.fmax.accumulate(prices, axis=1)
+        drawdown = prices / running_max - 1
+
+        # 最近 ANALYTICS_CROSS_LOOKBACK 个 bar 内快慢线符号变化即视为交叉
+        recent = ANALYTICS_CROSS_LOOKBACK + 1
+        sma_sign = np.sign(sma_fast[:, -recent:] - sma_slow[:, -recent:])
+        ema_sign = np.sign(ema_fast[:, -recent:] - ema_slow[:, -recent:])
+
+    signals = {}
+    for row, asset in enumerate(assets):
+        if (history[row] < ANALYTICS_EMA_TRUNCATION * ANALYTICS_SLOW_WINDOW
+                or samples[row] < ANALYTICS_SLOW_WINDOW):
+            continue
+        trend = None
+        if not (np.isnan(ema_fast[row, -1]) or np.isnan(ema_slow[row, -1])):
+            trend = 1 if ema_fast[row, -1] > ema_slow[row, -1] else -1
+        vol_history = volatility[row][~np.isnan(volatility[row])]
+        signals[asset] = {
+            'price': float(prices[row, -1]),
+            'volatility': float(volatility[row, -1]),
+            'volatility_median': float(np.median(vol_history)) if len(vol_history) else float('nan'),
+            'sma_fast': float(sma_fast[row, -1]),
+            'sma_slow': float(sma_slow[row, -1]),
+            'ema_fast': float(ema_fast[row, -1]),
+            'ema_slow': float(ema_slow[row, -1]),
+            'trend': trend,
+            'sma_cross': _last_cross(sma_sign[row]),
+            'ema_cross': _last_cross(ema_sign[row]),
+            'drawdown': float(drawdown[row, -1]) * 100,
+            'max_drawdown': float(np.nanmin(drawdown[row])) * 100,
+        }
+
+    if 'XAU' in assets and 'XAG' in assets:
+        gold, silver = list(assets).index('XAU'), list(assets).index('XAG')
+        ratio = prices[gold] / prices[silver]
+        ratio = ratio[~np.isnan(ratio)]
+        if (observed[gold] & observed[silver]).sum() >= ANALYTICS_SLOW_WINDOW:
+            std = ratio.std()
+            signals['ratio'] = {
+                'value': float(ratio[-1]),
+                'mean': float(ratio.mean()),
+                'zscore': float((ratio[-1] - ratio.mean()) / std) if std > 0 else 0.0,
+            }
+    return signals
+
+
+def _last_cross(signs):
+    """快慢线符号序列中的最近一次交叉：1 金叉，-1 死叉，0 无"""
+    signs = signs[~np.isnan(signs)]
+    changes = np.nonzero(np.diff(signs))[0]
+    if len(changes) == 0:
+        return 0
+    return 1 if signs[changes[-1] + 1] > 0 else -1
+
+
+def describe_signals(name, signal):
+    """把一个资产的技术指标转换成一行点评"""
+    notes = []
+    if signal['ema_cross'] == 1:
+        notes.append("EMA 刚形成金叉")
+    elif signal['ema_cross'] == -1:
+        notes.append("EMA 刚形成死叉")
+    elif signal['trend'] is None:
+        notes.append("快慢线数据不足，暂无趋势信号")
+    else:
+        notes.append("处于上升趋势（快线在慢线上方）" if signal['trend'] > 0 else "处于下降趋势（快线在慢线下方）")
+    if signal['sma_cross'] and signal['sma_cross'] != signal['ema_cross']:
+        notes.append("SMA 金叉" if signal['sma_cross'] > 0 else "SMA 死叉")
+
+    median = signal['volatility_median']
+    if median and median > 0:
+        if signal['volatility'] > median * 1.5:
+            notes.append(f"波动放大（{signal['volatility']:.2f}%，常态 {median:.2f}%）")
+        elif signal['volatility'] < median * 0.5:
+            notes.append(f"波动收窄（{signal['volatility']:.2f}%）")
+
+    if signal['drawdown'] <= -ANALYTICS_DRAWDOWN_ALERT:
+        notes.append(f"距高点回撤 {-signal['drawdown']:.1f}%")
+    elif signal['drawdown'] > -0.5:
+        notes.append("接近区间高点")
+
+    if signal['trend'] is None:
+        emoji = "🟡"
+    elif signal['trend'] > 0 and signal['ema_cross'] >= 0:
+        emoji = "🟢"
+    elif signal['trend'] < 0 and (signal['ema_cross'] < 0 or signal['drawdown'] <= -ANALYTICS_DRAWDOWN_ALERT):
+        emoji = "🔴"
+    else:
+        emoji = "🟡"
+    return f"{emoji} **{name}**: " + "，".join(notes)
+
+
+# ==================== 分位数草图 ====================
+
+class TDigest:
+    """
+    可合并的 t-digest 分位数草图：以 (均值, 权重) 质心近似分布，内存与样本数无关
+
+    新样本先进入缓冲区，压缩时按 k1 尺度函数 k(q) = δ/2π·asin(2q-1) 把相邻质心合并，
+    两端质心更细，因此尾部分位数更准。两个草图合并即把质心合在一起重新压缩。
+    """
+
+    def __init__(self, compression=SKETCH_COMPRESSION, means=None, weights=None, count=0,
+                 minimum=math.inf, maximum=-math.inf):
+        self.compression = compression
+        self.means = np.asarray(means if means is not None else [], dtype=np.float64)
+        self.weights = np.asarray(weights if weights is not None else [], dtype=np.float64)
+        self.count = count
+        self.min = minimum
+        self.max = maximum
+        self._buffer = []
+
+    def add(self, values):
+        values = np.asarray(values, dtype=np.float64).ravel()
+        values = values[np.isfinite(values)]
+        if len(values) == 0:
+            return
+        self._buffer.append(values)
+        self.count += len(values)
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        if sum(len(chunk) for chunk in self._buffer) > self.compression * 10:
+            self._compress()
+
+    def merge(self, other):
+        """把另一个草图并入当前草图"""
+        other._compress()
+        self._compress()
+        self.means = np.concatenate([self.means, other.means])
+        self.weights = np.concatenate([self.weights, other.weights])
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress(force=True)
+        return self
+
+    def _compress(self, force=False):
+        if not self._buffer and not force:
+            return
+        means = np.concatenate([self.means] + self._buffer)
+        weights = np.concatenate([self.weights] + [np.ones(len(chunk)) for chunk in self._buffer])
+        self._buffer = []
+        if len(means) == 0:
+            return
+        order = np.argsort(means, kind='stable')
+        means, weights = means[order], weights[order]
+        total = weights.sum()
+        q_mid = (np.cumsum(weights) - weights / 2) / total
+        k = self.compression / (2 * math.pi) * np.arcsin(2 * q_mid - 1)
+        groups = np.floor(k - k[0]).astype(np.int64)
+        group_weights = np.bincount(groups, weights)
+        keep = group_weights > 0
+        self.weights = group_weights[keep]
+        self.means = np.bincount(groups, weights * means)[keep] / self.weights
+
+    def _cdf_points(self):
+        """质心中点的累计概率（含两端最小/最大值），用于插值"""
+        self._compress()
+        q_mid = (np.cumsum(self.weights) - self.weights / 2) / self.weights.sum()
+        return np.r_[self.min, self.means, self.max], np.r_[0.0, q_mid, 1.0]
+
+    def quantile(self, q):
+        if self.count == 0:
+            return math.nan
+        values, cdf = self._cdf_points()
+        return float(np.interp(q, cdf, values))
+
+    def percentile_of(self, value):
+        """value 在分布中的百分位（0-100）"""
+        if self.count == 0:
+            return math.nan
+        values, cdf = self._cdf_points()
+        return float(np.interp(value, values, cdf)) * 100
+
+    def to_dict(self):
+        self._compress()
+        return {
+            'compression': self.compression, 'count': self.count, 'min': self.min, 'max': self.max,
+            'means': self.means.tolist(), 'weights': self.weights.tolist(),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['compression'], data['means'], data['weights'], data['count'], data['min'], data['max'])
+
+
+class MarketSketchBook:
+    """
+    金银比与各资产日收益率的分位数草图，持久化到 STATE_DIR/quantile-sketches.json
+
+    每个草图记录已覆盖的日期区间 [first_day, last_day]（UTC 自然日序号）。
+    update() 只读取区间两侧尚未覆盖的完整交易日：向后是新产生的数据，
+    向前是回补得到的更早 K 线；每段先建一个独立草图再合并进来，不重扫已覆盖历史
+    """
+
+    def __init__(self, path):
+        self.path = path
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                raw = json.load(f)
+        except (OSError, ValueError):
+            raw = {}
+        self.entries = {}
+        for name, entry in raw.items():
+            entry = dict(entry)
+            entry['digest'] = TDigest.from_dict(entry['digest'])
+            self.entries[name] = entry
+
+    def digest(self, name):
+        entry = self.entries.get(name)
+        return entry['digest'] if entry else None
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        raw = {name: dict(entry, digest=entry['digest'].to_dict()) for name, entry in self.entries.items()}
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(raw, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    @staticmethod
+    def _first_day(asset, store=None, kline_store=None):
+        """资产最早一条数据所在的日期序号，无数据时返回 None"""
+        store = store or TICK_STORE
+        kline_store = kline_store or KLINE_STORE
+        starts = []
+        records = store.read(asset)
+        if len(records):
+            starts.append(int(records['ts'][0]))
+        symbol = KLINE_SYMBOLS.get(asset)
+        if symbol:
+            for interval in KLINE_INTERVAL_MS:
+                open_time = kline_store.read(symbol, interval, ('open_time',))['open_time']
+                if len(open_time):
+                    starts.append(int(open_time[0]) // 1000)
+        return min(starts) // 86400 if starts else None
+
+    @staticmethod
+    def _daily_closes(assets, first_day, end_day, store=None, kline_store=None):
+        """
+        [first_day, end_day) 每日收盘价矩阵，形状 (资产数, 天数)
+
+        当天没有真实样本的位置为 NaN（不向前填充），避免无数据的日子被当成
+        重复的金银比和 0% 收益率计入草图
+        """
+        _, closes, observed = load_price_matrix(list(assets), first_day * 86400, end_day * 86400 - 1, 86400,
+                                                store, kline_store, return_observed=True)
+        closes[~observed] = np.nan
+        return closes
+
+    def _ingest(self, name, assets, series_fn, today, store=None, kline_store=None):
+        """把 name 草图的覆盖区间扩展到所有已有的完整交易日"""
+        available = [self._first_day(asset, store, kline_store) for asset in assets]
+        if any(day is None for day in available):
+            return
+        start_day = max(available)
+        entry = self.entries.get(name)
+        if entry is None:
+            ranges = [(start_day, today)]
+        else:
+            ranges = [(start_day, entry['first_day']), (entry['last_day'] + 1, today)]
+        for lo, hi in ranges:
+            if lo >= hi:
+                continue
+            # 不裁剪两端的 NaN：第 0 列始终是 lo 这一天，才能与已覆盖区间按日衔接
+            closes = self._daily_closes(assets, lo, hi, store, kline_store)
+            valid = np.where(np.isfinite(closes).all(axis=0))[0]
+            if len(valid) == 0:
+                continue
+            chunk = TDigest()
+            entry = self.entries.get(name)
+            prepend = entry is not None and hi == entry['first_day']
+            chunk.add(series_fn(closes, entry, prepend))
+            if entry is None:
+                entry = self.entries[name] = {
+                    'digest': chunk, 'first_day': lo + int(valid[0]), 'last_day': lo + int(valid[-1]),
+                    'first_close': closes[:, valid[0]].tolist(), 'last_close': closes[:, valid[-1]].tolist(),
+                }
+                continue
+            entry['digest'].merge(chunk)
+            if prepend:
+                entry['first_day'] = lo + int(valid[0])
+                entry['first_close'] = closes[:, valid[0]].tolist()
+            else:
+                entry['last_day'] = lo + int(valid[-1])
+                entry['last_close'] = closes[:, valid[-1]].tolist()
+
+    def update(self, now=None, store=None, kline_store=None):
+        """把截至昨天（UTC）的完整交易日并入各草图并保存"""
+        today = int(now if now is not None else time.time()) // 86400
+
+        def ratio_series(closes, entry, prepend):
+            return closes[0] / closes[1]
+
+        def return_series(closes, entry, prepend):
+            # 与相邻已覆盖区间衔接处的那一天收益率也在这里补上；
+            # 只有相邻两天都有样本才产生收益率，NaN 由 TDigest.add 丢弃
+            if entry is not None:
+                closes = np.c_[closes, entry['first_close']] if prepend else np.c_[entry['last_close'], closes]
+            return (closes[0, 1:] / closes[0, :-1] - 1) * 100
+
+        self._ingest('ratio', ('XAU', 'XAG'), ratio_series, today, store, kline_store)
+        for asset in ANALYTICS_ASSETS:
+            self._ingest(f"return:{asset}", (asset,), return_series, today, store, kline_store)
+        self.save()
+        return self
+
+    def describe(self, name, value):
+        """value 在草图中的百分位描述，例如“第 93 百分位（1,200 天）”；样本不足时返回 None"""
+        digest = self.digest(name)
+        if digest is None or digest.count < SKETCH_MIN_SAMPLES:
+            return None
+        return f"第 {digest.percentile_of(value):.0f} 百分位（{digest.count:,} 天）"
+
+
+# ==================== 走势图 ====================
+
+def _png_bytes(pixels):
+    """把 (高, 宽, 3) 的 uint8 数组编码为 PNG（每行无滤波，zlib 压缩）"""
+    height, width, _ = pixels.shape
+    raw = np.concatenate([np.zeros((height, 1), dtype=np.uint8), pixels.reshape(height, width * 3)], axis=1)
+
+    def chunk(tag, data):
+        return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data) & 0xffffffff)
+
+    return (b'\x89PNG\r\n\x1a\n' +
+            chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)) +
+            chunk(b'IDAT', zlib.compress(raw.tobytes(), 6)) +
+            chunk(b'IEND', b''))
+
+
+def render_sparkline(ts, prices, width=CHART_WIDTH, height=CHART_HEIGHT):
+    """
+    用 NumPy 栅格化迷你走势图，返回 PNG 字节
+
+    每列取该列时间区间内价格的最小/最大值（含相邻列边界的插值）画竖线段，
+    再把折线下方填充浅色；上涨为绿色、下跌为红色
+    """
+    pad = 3
+    ts = np.asarray(ts, dtype=np.float64)
+    prices = np.asarray(prices, dtype=np.float64)
+    valid = np.isfinite(prices)
+    ts, prices = ts[valid], prices[valid]
+    pixels = np.full((height, width, 3), 255, dtype=np.uint8)
+    if len(prices) < 2:
+        return _png_bytes(pixels)
+
+    low, high = prices.min(), prices.max()
+    span_t = max(ts[-1] - ts[0], 1)
+    x = (ts - ts[0]) / span_t * (width - 1)
+    y = pad + (high - prices) / max(high - low, 1e-12) * (height - 1 - 2 * pad)
+
+    edges = np.interp(np.clip(np.arange(width + 1) - 0.5, 0, width - 1), x, y)
+    col_low = np.minimum(edges[:-1], edges[1:])
+    col_high = np.maximum(edges[:-1], edges[1:])
+    cols = np.rint(x).astype(np.int64)
+    np.minimum.at(col_low, cols, y)
+    np.maximum.at(col_high, cols, y)
+
+    line, fill = ((22, 163, 74), (220, 252, 231)) if prices[-1] >= prices[0] else ((220, 38, 38), (254, 226, 226))
+    rows = np.arange(height)[:, None]
+    pixels[rows > col_high[None, :]] = fill
+    pixels[(rows >= np.floor(col_low - 0.5)) & (rows <= np.ceil(col_high + 0.5))] = line
+    return _png_bytes(pixels)
+
+
+class ChartCache:
+    """
+    走势图缓存：价格先按像素列宽的时间桶（与纪元对齐）取每桶最后一个价格再渲染，
+    PNG 以 (资产, 窗口, 图像内容校验和) 命名；新样本没有让图像发生可见变化时沿用原文件。
+    上传到钉钉得到的 media_id 记录在 media.json 中，有效期内不重复上传
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.media_path = os.path.join(root, "media.json")
+        try:
+            with open(self.media_path, 'r', encoding='utf-8') as f:
+                self.media = json.load(f)
+        except (OSError, ValueError):
+            self.media = {}
+
+    def render(self, asset, window, now=None, store=None, kline_store=None):
+        """返回资产在窗口内的走势图路径，图像未变化时不重写文件；无数据时返回 None"""
+        now = int(now if now is not None else time.time())
+        bucket = max(1, CHART_WINDOWS[window] // CHART_WIDTH)
+        start = (now // bucket - CHART_WIDTH + 1) * bucket
+        ts, prices = load_asset_history(asset, start, now, store, kline_store)
+        if len(ts) < 2:
+            return None
+        idx = ts // bucket
+        is_last = np.r_[idx[1:] != idx[:-1], True]
+        png = render_sparkline(idx[is_last] * bucket, prices[is_last])
+        path = os.path.join(self.root, f"{asset}_{window}_{zlib.crc32(png):08x}.png")
+        if os.path.exists(path):
+            return path
+        os.makedirs(self.root, exist_ok=True)
+        prefix = f"{asset}_{window}_"
+        for name in os.listdir(self.root):
+            if name.startswith(prefix) and name.endswith('.png'):
+                os.remove(os.path.join(self.root, name))
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(png)
+        os.replace(tmp_path, path)
+        return path
+
+    def cached_media_id(self, path, now=None):
+        """有效期内已上传过的 media_id，否则返回 None"""
+        now = now if now is not None else time.time()
+        cached = self.media.get(os.path.basename(path))
+        if cached and now - cached['uploaded_at'] < CHART_MEDIA_TTL:
+            return cached['media_id']
+        return None
+
+    @staticmethod
+    def upload(path, access_token):
+        """通过 dingtalk-file-sender 上传图片并返回 media_id（不修改缓存，可在线程池中调用）"""
+        return _load_dingtalk_sender().upload_media(access_token, path, 'image')['media_id']
+
+    def remember(self, uploads, now=None):
+        """把 {路径: media_id} 写入 media.json，并清理已删除图片的记录"""
+        now = now if now is not None else time.time()
+        self.media = {key: value for key, value in self.media.items()
+                      if os.path.exists(os.path.join(self.root, key))}
+        for path, media_id in uploads.items():
+            self.media[os.path.basename(path)] = {'media_id': media_id, 'uploaded_at': now}
+        tmp_path = self.media_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.media, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.media_path)
+
+
+def _load_dingtalk_sender():
+    """加载 dingtalk-file-sender/dingtalk_sender.py（目录名含连字符，按路径导入）"""
+    module = sys.modules.get('dingtalk_sender')
+    if module is None:
+        spec = importlib.util.spec_from_file_location(
+            'dingtalk_sender', os.path.join(DINGTALK_SENDER_DIR, 'dingtalk_sender.py'))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        sys.modules['dingtalk_sender'] = module
+    return module
+
+
+def prepare_report_charts(assets=CHART_ASSETS, windows=tuple(CHART_WINDOWS), cache=None,
+                          deadline_seconds=CHART_DEADLINE):
+    """
+    渲染并上传报告用的走势图，返回 {资产: {窗口: media_id}}
+
+    先在本地渲染全部图片，media_id 仍有效的直接复用；其余只取一次 access_token，
+    再并发上传。取令牌失败即放弃本次上传，超过 deadline_seconds 仍未完成的图跳过。
+    单张图失败只跳过该图，不影响报告发送
+    """
+    cache = cache or ChartCache(CHART_DIR)
+    deadline = time.monotonic() + deadline_seconds
+    now = time.time()
+    media_ids = {}
+    missing = {}
+    for asset in assets:
+        for window in windows:
+            try:
+                path = cache.render(asset, window, now)
+            except Exception as e:
+                print(f"{asset} {window} 走势图生成失败：{e}")
+                continue
+            if not path:
+                continue
+            media_ids[(asset, window)] = cache.cached_media_id(path, now)
+            if media_ids[(asset, window)] is None:
+                missing[(asset, window)] = path
+
+    access_token = None
+    if missing:
+        try:
+            access_token = _load_dingtalk_sender().get_access_token()
+        except Exception as e:
+            print(f"钉钉鉴权失败，本次跳过 {len(missing)} 张走势图上传：{e}")
+    if access_token:
+        media_ids.update(_upload_charts(cache, missing, access_token, deadline, now))
+
+    charts = {}
+    for (asset, window), media_id in media_ids.items():
+        if media_id:
+            charts.setdefault(asset, {})[window] = media_id
+    return charts
+
+
+def _upload_charts(cache, missing, access_token, deadline, now):
+    """并发上传 {(资产, 窗口): 路径}，返回截止时间前成功的 {(资产, 窗口): media_id}"""
+
+    pool = ThreadPoolExecutor(max_workers=CHART_UPLOAD_WORKERS)
+    futures = {pool.submit(cache.upload, path, access_token): key for key, path in missing.items()}
+    uploaded = {}
+    try:
+        done, not_done = wait(futures, timeout=max(0, deadline - time.monotonic()))
+        for future in done:
+            asset, window = futures[future]
+            try:
+                uploaded[(asset, window)] = future.result()
+            except Exception as e:
+                print(f"{asset} {window} 走势图上传失败：{e}")
+        if not_done:
+            print(f"走势图上传超过截止时间，跳过 {len(not_done)} 张")
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+    if uploaded:
+        cache.remember({missing[key]: media_id for key, media_id in uploaded.items()}, now)
+    return uploaded
+
+
+def format_charts_markdown(charts, watchlist=None):
+    """报告中的走势图区块"""
+    if not charts:
+        return ""
+    names = dict(ASSET_NAMES, bitcoin="比特币")
+    for record in (watchlist or {}).values():
+        names.setdefault(record['id'], record['name'])
+    lines = ["### 📉 走势", ""]
+    for asset, images in charts.items():
+        cells = " ".join(f"{window} ![{window}]({media_id})" for window, media_id in images.items())
+        lines.append(f"**{names.get(asset, asset)}** {cells}")
+        lines.append("")
+    return "\n".join(lines) + "\n---\n\n"
+
+
 # ==================== 市场分析 ====================
 
-def analyze_market(gold_data, silver_data, btc_data):
-    """生成市场分析报告"""
+def analyze_market(gold_data, silver_data, btc_data, signals=None):
+    """
+    生成市场分析报告
+
+    signals 为 compute_signals() 的结果：有足够历史的资产按技术指标点评，
+    其余按 24h 涨跌幅分档
+    """
     analysis = []
+    signals = signals or {}
 
     # 黄金分析
-    if gold_data:
+    if gold_data and 'XAU' in signals:
+        analysis.append(describe_signals("黄金", signals['XAU']))
+    elif gold_data:
         gold_change_pct = gold_data.get('change_pct', 0)
         if gold_change_pct > 1:
             analysis.append("🟢 **黄金**: 强势上涨，涨幅超过 1%")
@@ -234,7 +2310,9 @@ def analyze_market(gold_data, silver_data, btc_data):
             analysis.append("🔴 **黄金**: 明显下跌")
 
     # 白银分析
-    if silver_data:
+    if silver_data and 'XAG' in signals:
+        analysis.append(describe_signals("白银", signals['XAG']))
+    elif silver_data:
         silver_change_pct = silver_data.get('change_pct', 0)
         if silver_change_pct > 2:
             analysis.append("🟢 **白银**: 大幅上涨，表现强劲")
@@ -246,7 +2324,9 @@ def analyze_market(gold_data, silver_data, btc_data):
             analysis.append("🔴 **白银**: 明显下跌")
 
     # 比特币分析
-    if btc_data:
+    if btc_data and 'bitcoin' in signals:
+        analysis.append(describe_signals("比特币", signals['bitcoin']))
+    elif btc_data:
         btc_change_pct = btc_data.get('change_24h_pct', 0)
         if btc_change_pct > 3:
             analysis.append("🟢 **比特币**: 大幅上涨，市场情绪乐观")
@@ -257,6 +2337,16 @@ def analyze_market(gold_data, silver_data, btc_data):
         else:
             analysis.append("🔴 **比特币**: 明显下跌")
 
+    # 金银比相对自身历史
+    ratio = signals.get('ratio')
+    if ratio:
+        if ratio['zscore'] >= 2:
+            analysis.append(f"📈 **金银比**: 处于历史高位（z={ratio['zscore']:+.1f}），白银相对低估")
+        elif ratio['zscore'] <= -2:
+            analysis.append(f"📉 **金银比**: 处于历史低位（z={ratio['zscore']:+.1f}），白银相对高估")
+        else:
+            analysis.append(f"⚖️ **金银比**: 处于历史常态区间（z={ratio['zscore']:+.1f}）")
+
     # 综合点评
     if gold_data and btc_data:
         gold_up = gold_data.get('change_pct', 0) > 0
@@ -290,6 +2380,280 @@ def send_dingtalk_message(title, markdown_text):
     return response.json()
 
 
+# ==================== 变化抑制 ====================
+
+class ReportSuppressor:
+    """
+    报告变化抑制：记住上次实际发送的快照（STATE_DIR/last-report.json），
+    只有某项较上次变动超过 NOTIFY_THRESHOLDS，或距上次发送超过
+    NOTIFY_HEARTBEAT 秒时才发送，避免无变化时刷屏、占用钉钉每分钟 20 条的额度
+    """
+
+    def __init__(self, path, thresholds=None, heartbeat=None):
+        self.path = path
+        self.thresholds = thresholds or NOTIFY_THRESHOLDS
+        self.heartbeat = heartbeat if heartbeat is not None else NOTIFY_HEARTBEAT
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                self.last = json.load(f)
+        except (OSError, ValueError):
+            self.last = None
+
+    def decide(self, values, now=None):
+        """
+        返回 (是否发送, 原因, 变动项)
+        原因为 "first" / "heartbeat" / "delta" / "quiet"；
+        变动项为 {项目: (上次值, 本次值, 变动百分比)}，只含超过阈值的项目
+        """
+        now = now if now is not None else time.time()
+        if not self.last:
+            return True, "first", {}
+        deltas = {}
+        for key, threshold in self.thresholds.items():
+            old, new = self.last['values'].get(key), values.get(key)
+            if not old or new is None:
+                continue
+            pct = (new - old) / old * 100
+            if abs(pct) >= threshold:
+                deltas[key] = (old, new, pct)
+        if deltas:
+            return True, "delta", deltas
+        if now - self.last['sent_at'] >= self.heartbeat:
+            return True, "heartbeat", {}
+        return False, "quiet", {}
+
+    def record(self, values, now=None):
+        """发送成功后保存快照"""
+        self.last = {'sent_at': now if now is not None else time.time(), 'values': values}
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.last, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+def snapshot_values(gold, silver, bitcoin, usd_to_cny):
+    """变化抑制比较的数值快照"""
+    return {
+        'gold': gold['price_usd_oz'],
+        'silver': silver['price_usd_oz'],
+        'bitcoin': bitcoin['price_usd'],
+        'usd_to_cny': usd_to_cny,
+    }
+
+
+def build_delta_markdown(deltas, since):
+    """精简的变动消息：只列出超过阈值的项目，返回 (标题, 正文)"""
+    names = {'gold': "黄金", 'silver': "白银", 'bitcoin': "比特币", 'usd_to_cny': "美元/人民币"}
+    lines = [
+        f"- **{names.get(key, key)}** {old:,.{4 if key == 'usd_to_cny' else 2}f} → "
+        f"**{new:,.{4 if key == 'usd_to_cny' else 2}f}** ({pct:+.2f}%)"
+        for key, (old, new, pct) in deltas.items()
+    ]
+    since_text = datetime.fromtimestamp(since).strftime('%m-%d %H:%M')
+    title = "📣 " + "、".join(names.get(key, key) for key in deltas) + " 价格变动"
+    markdown_text = (
+        f"## 📣 行情变动（较 {since_text} 推送）\n\n" + "\n".join(lines) +
+        f"\n\n*更新时间：{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}*\n"
+    )
+    return title, markdown_text
+
+
+# ==================== 价格预警规则 ====================
+
+class AlertRuleEngine:
+    """
+    价格预警规则引擎
+
+    规则文件（JSON）中每条规则：id、asset（资产 id，金银比用 "XAU/XAG"）、
+    metric（price / change_24h / change_1h）、op（">" 上穿、"<" 下穿、
+    "crosses" 双向穿越）、value，可选 user、message、cooldown、hysteresis_pct。
+
+    每个 (asset, metric) 维护按阈值排序的索引：新值到来时只需在
+    (上次值, 新值] 区间内二分查找被穿越的阈值，不遍历全部规则。
+    触发后规则解除武装，直到数值回撤超过 hysteresis_pct 才重新武装
+    （同样通过二分查找重新武装水位），再叠加 cooldown 秒冷却，避免反复报警。
+    """
+
+    def __init__(self, rules, state_path, defaults=None):
+        defaults = defaults or {}
+        self.state_path = state_path
+        self.rules = {}
+        # (asset, metric) -> 方向 -> {'fire': [(阈值, 规则键)], 'rearm': [(水位, 规则键)],
+        #                           'fire_keys' / 'rearm_keys': 对应的有序阈值列表，供 bisect 直接使用}
+        self.index = {}
+        for rule in rules:
+            rule = dict(defaults, **rule)
+            rule.setdefault('cooldown', ALERT_DEFAULT_COOLDOWN)
+            rule.setdefault('hysteresis_pct', ALERT_DEFAULT_HYSTERESIS_PCT)
+            op = rule.get('op', '>')
+            directions = {'>': ['up'], '<': ['down'], 'crosses': ['up', 'down']}.get(op)
+            if directions is None:
+                print(f"预警规则 {rule.get('id')} 的 op 无效：{op}")
+                continue
+            threshold = float(rule['value'])
+            band = abs(threshold) * rule['hysteresis_pct'] / 100
+            for direction in directions:
+                key = f"{rule['id']}:{direction}"
+                self.rules[key] = dict(rule, direction=direction)
+                slot = self.index.setdefault((rule['asset'], rule.get('metric', 'price')), {}).setdefault(
+                    direction, {'fire': [], 'rearm': []})
+                slot['fire'].append((threshold, key))
+                slot['rearm'].append((threshold - band if direction == 'up' else threshold + band, key))
+        for directions in self.index.values():
+            for slot in directions.values():
+                for name in ('fire', 'rearm'):
+                    slot[name].sort()
+                    slot[f"{name}_keys"] = [entry[0] for entry in slot[name]]
+        self.state = {'last_values': {}, 'disarmed': {}, 'last_fired': {}}
+        self._load_state()
+
+    @classmethod
+    def from_file(cls, path=None, state_path=None):
+        """从规则文件加载；文件不存在时返回空引擎"""
+        path = path or ALERT_RULES_FILE
+        state_path = state_path or os.path.join(STATE_DIR, "alert-state.json")
+        if not os.path.exists(path):
+            return cls([], state_path)
+        with open(path, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+        return cls(config.get('rules', []), state_path, config.get('defaults'))
+
+    def _load_state(self):
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                self.state.update(json.load(f))
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"读取预警状态失败，重新开始：{e}")
+
+    def save_state(self):
+        os.makedirs(os.path.dirname(self.state_path), exist_ok=True)
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.state_path)
+
+    @staticmethod
+    def _crossed(entries, thresholds, low, high, upward):
+        """
+        二分查找被穿越的条目：上行时取阈值落在 (low, high] 的条目，
+        下行时取落在 [low, high) 的条目；thresholds 为 entries 中预先提取的有序阈值
+        """
+        if upward:
+            return entries[bisect.bisect_right(thresholds, low):bisect.bisect_right(thresholds, high)]
+        return entries[bisect.bisect_left(thresholds, low):bisect.bisect_left(thresholds, high)]
+
+    def evaluate(self, asset, metric, value, now=None):
+        """输入一个新值，返回本次触发的规则列表"""
+        now = now if now is not None else time.time()
+        series_key = f"{asset}|{metric}"
+        previous = self.state['last_values'].get(series_key)
+        self.state['last_values'][series_key] = value
+        directions = self.index.get((asset, metric))
+        if not directions or previous == value:
+            return []
+
+        triggered = []
+        disarmed = self.state['disarmed']
+        for direction, slot in directions.items():
+            upward_rule = direction == 'up'
+            if previous is None:
+                # 首次观测：上穿规则视为从 -inf 上升，下穿规则视为从 +inf 下降
+                moving_up, start = upward_rule, (-math.inf if upward_rule else math.inf)
+            else:
+                moving_up, start = value > previous, previous
+            low, high = (start, value) if moving_up else (value, start)
+
+            if moving_up == upward_rule:
+                for _, key in self._crossed(slot['fire'], slot['fire_keys'], low, high, moving_up):
+                    if disarmed.get(key):
+                        continue
+                    if previous is None and self.rules[key].get('op') == 'crosses':
+                        # 双向穿越规则需要真实的上一个值才能判断
+                        continue
+                    disarmed[key] = True
+                    rule = self.rules[key]
+                    if now - self.state['last_fired'].get(key, 0) < rule['cooldown']:
+                        continue
+                    self.state['last_fired'][key] = now
+                    triggered.append(dict(rule, observed=value, previous=previous))
+            elif previous is not None:
+                # 反向运动：越过重新武装水位的规则恢复
+                for _, key in self._crossed(slot['rearm'], slot['rearm_keys'], low, high, moving_up):
+                    disarmed.pop(key, None)
+        return triggered
+
+    def evaluate_many(self, values, now=None):
+        """批量输入 {(asset, metric): value}，返回全部触发的规则"""
+        triggered = []
+        for (asset, metric), value in values.items():
+            if value is not None:
+                triggered.extend(self.evaluate(asset, metric, value, now))
+        return triggered
+
+
+def collect_metric_values(market, now=None):
+    """从一次采集结果中提取预警指标 {(asset, metric): value}"""
+    now = int(now if now is not None else time.time())
+    values = {}
+    precious_metals = market.get('precious_metals') or {}
+    for asset, key in (('XAU', 'gold'), ('XAG', 'silver')):
+        data = precious_metals.get(key)
+        if data and "估算" not in market.get('sources', {}).get(key, ""):
+            values[(asset, 'price')] = data['price_usd_oz']
+            values[(asset, 'change_24h')] = data['change_pct']
+    bitcoin = market.get('bitcoin')
+    if bitcoin:
+        values[('bitcoin', 'price')] = bitcoin['price_usd']
+        values[('bitcoin', 'change_24h')] = bitcoin['change_24h_pct']
+    for record in (market.get('watchlist') or {}).values():
+        values.setdefault((record['id'], 'price'), record['price_usd'])
+        values.setdefault((record['id'], 'change_24h'), record.get('change_pct'))
+
+    if values.get(('XAU', 'price')) and values.get(('XAG', 'price')):
+        values[('XAU/XAG', 'price')] = values[('XAU', 'price')] / values[('XAG', 'price')]
+
+    # 1 小时涨跌幅：与时间序列中一小时前最近的一条记录比较
+    for (asset, metric), price in list(values.items()):
+        if metric != 'price' or '/' in asset:
+            continue
+        past = TICK_STORE.read(asset, now - 3600 - ALERT_CHANGE_1H_TOLERANCE, now - 3600 + 1)
+        if len(past):
+            values[(asset, 'change_1h')] = (price / float(past['price'][-1]) - 1) * 100
+    return values
+
+
+def format_alerts_markdown(alerts):
+    """把触发的预警合并成一条钉钉消息"""
+    lines = ["## 🚨 价格预警", ""]
+    for alert in alerts:
+        metric_name = {'price': "价格", 'change_24h': "24h 涨跌幅", 'change_1h': "1h 涨跌幅"}.get(
+            alert.get('metric', 'price'), alert.get('metric'))
+        arrow = "上穿" if alert['direction'] == 'up' else "下穿"
+        suffix = "%" if alert.get('metric', 'price').startswith('change') else ""
+        mention = f" @{alert['user']}" if alert.get('user') else ""
+        message = alert.get('message') or f"{alert['asset']} {metric_name}{arrow} {alert['value']}{suffix}"
+        lines.append(f"- **{message}**（当前 {alert['observed']:,.2f}{suffix}）{mention}")
+    lines.append("")
+    lines.append(f"*{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}*")
+    return "\n".join(lines)
+
+
+def dispatch_alerts(alerts, sender=None):
+    """通过钉钉发送触发的预警（合并为一条消息）"""
+    if not alerts:
+        return None
+    sender = sender or send_dingtalk_message
+    result = sender(f"🚨 价格预警（{len(alerts)} 条）", format_alerts_markdown(alerts))
+    if result.get('errcode') == 0:
+        print(f"✅ 已发送 {len(alerts)} 条预警")
+    else:
+        print(f"❌ 预警发送失败：{result}")
+    return result
+
+
 def format_number(num, decimals=2):
     """格式化数字"""
     if num >= 1e9:
@@ -302,41 +2666,57 @@ def format_number(num, decimals=2):
         return f"{num:.{decimals}f}"
 
 
-def main():
-    print(f"开始获取实时价格数据... [{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}]")
-
-    # 获取数据
-    print("正在获取黄金/白银价格...")
-    precious_metals = get_gold_silver_prices()
-
-    print("正在获取比特币价格...")
-    bitcoin = get_bitcoin_price()
-
-    print("正在获取美元兑人民币汇率...")
-    usd_to_cny = get_usd_to_cny_rate()
-
-    # 检查数据获取是否成功
-    if not precious_metals:
-        print("错误：无法获取贵金属价格数据")
-        return
-
-    if not bitcoin:
-        print("错误：无法获取比特币价格数据")
-        return
-
-    gold = precious_metals['gold']
-    silver = precious_metals['silver']
-
-    source_info = precious_metals.get('source', 'Unknown')
-
-    # 计算国内价格
-    gold_cny_gram = calculate_domestic_price(gold['price_usd_oz'], usd_to_cny)
-    silver_cny_gram = calculate_domestic_price(silver['price_usd_oz'], usd_to_cny)
+def build_report_markdown(gold, silver, bitcoin, usd_to_cny, sources=None, watchlist=None,
+                          signals=None, fx_quote=None, charts=None, sketches=None):
+    """
+    构建钉钉 Markdown 报告，返回 (标题, 正文)
+    charts 为 prepare_report_charts() 的结果，sketches 为 MarketSketchBook（用于历史分位）
+    """
+    # 计算各地价格：一次换算出 资产 × 币种 × 单位 全矩阵
+    rates = dict(fx_quote['rates']) if fx_quote else {}
+    rates['CNY'] = usd_to_cny
+    metal_prices = {'XAU': gold['price_usd_oz'], 'XAG': silver['price_usd_oz']}
+    for record in (watchlist or {}).values():
+        if record['kind'] == 'metal' and record['id'] not in metal_prices:
+            metal_prices[record['id']] = record['price_usd']
+    price_matrix = build_price_matrix(metal_prices, rates)
+    gold_cny_gram = round(price_matrix.get('XAU', 'CNY', 'gram'), 2)
+    silver_cny_gram = round(price_matrix.get('XAG', 'CNY', 'gram'), 2)
+    local_prices_text = format_local_prices_markdown(price_matrix)
 
     # 生成市场分析
-    analysis_lines = analyze_market(gold, silver, bitcoin)
+    analysis_lines = analyze_market(gold, silver, bitcoin, signals)
     analysis_text = "\n".join(analysis_lines)
 
+    # 本次各项数据实际采用的来源
+    sources = sources or {}
+    source_line = " | ".join(
+        f"{name} {sources[key]}"
+        for key, name in [('gold', "黄金"), ('silver', "白银"), ('bitcoin', "比特币"), ('fx', "汇率")]
+        if sources.get(key)
+    )
+    source_note = f"*本次来源：{source_line}*\n" if source_line else ""
+    watchlist_text = format_watchlist_markdown(watchlist) if watchlist else ""
+    charts_text = format_charts_markdown(charts, watchlist)
+    fx_note = f"（{describe_fx_quote(fx_quote)}）" if fx_quote else ""
+
+    # 金银比与当日涨跌幅的历史分位
+    ratio = gold['price_usd_oz'] / silver['price_usd_oz']
+    ratio_rank = sketches.describe('ratio', ratio) if sketches else None
+    if ratio_rank:
+        ratio_note = f"*(处于历史{ratio_rank}，比值高表示白银相对低估)*"
+    else:
+        ratio_note = "*(历史均值约 60-70，比值高表示白银相对低估)*"
+    change_ranks = []
+    if sketches:
+        for asset, name, change in (('XAU', "黄金", gold['change_pct']), ('XAG', "白银", silver['change_pct']),
+                                    ('bitcoin', "比特币", bitcoin['change_24h_pct'])):
+            rank = sketches.describe(f"return:{asset}", change)
+            if rank:
+                change_ranks.append(f"{name} {rank}")
+    if change_ranks:
+        ratio_note += "\n*涨跌幅在历史日收益中的分位：" + " | ".join(change_ranks) + "*"
+
     # 构建消息
     update_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
 
@@ -345,7 +2725,7 @@ def main():
     markdown_text = f"""## 💰 贵金属 & 加密货币实时行情
 
 **更新时间**: {update_time}
-**美元/人民币汇率**: {usd_to_cny:.4f}
+**美元/人民币汇率**: {usd_to_cny:.4f}{fx_note}
 
 ---
 
@@ -377,29 +2757,468 @@ def main():
 
 ---
 
-### 📊 市场趋势分析
+{local_prices_text}{watchlist_text}{charts_text}### 📊 市场趋势分析
 
 {analysis_text}
 
 ---
 
 ### 📈 金银比
-**金银比价**: {gold['price_usd_oz']/silver['price_usd_oz']:.2f} : 1
-*(历史均值约 60-70，比值高表示白银相对低估)*
+**金银比价**: {ratio:.2f} : 1
+{ratio_note}
 
 ---
 *数据来源：Binance | CoinGecko | ExchangeRate-API*
-*自动监控，仅供参考，不构成投资建议*
+{source_note}*自动监控，仅供参考，不构成投资建议*
 """
 
-    # 发送消息
-    print("正在发送钉钉通知...")
-    result = send_dingtalk_message(title, markdown_text)
+    return title, markdown_text
 
-    if result.get('errcode') == 0:
-        print("✅ 消息发送成功！")
+
+# ==================== 实时推流模式 ====================
+
+class BinanceTickerStream:
+    """
+    订阅币安组合 @ticker 推流，维护各交易对最新行情表
+
+    断线后按指数退避（带抖动）自动重连；url 可指向本地替身服务器用于测试
+    """
+
+    def __init__(self, symbols, url=BINANCE_WS_URL, on_tick=None):
+        self.symbols = [s.upper() for s in symbols]
+        self.url = url
+        self.on_tick = on_tick
+        self.ticks = {}
+        self.reconnects = 0
+
+    def stream_url(self):
+        streams = "/".join(f"{s.lower()}@ticker" for s in self.symbols)
+        return f"{self.url}?streams={streams}"
+
+    def handle_message(self, raw):
+        """解析一条组合流消息并更新行情表，返回交易对或 None"""
+        message = json.loads(raw)
+        data = message.get('data', message)
+        symbol = data.get('s')
+        if not symbol or 'c' not in data:
+            return None
+        self.ticks[symbol] = {
+            'price': float(data['c']),
+            'change_pct': float(data.get('P', 0)),
+            'quote_volume': float(data.get('q', 0)),
+            'event_time': data.get('E', int(time.time() * 1000)),
+        }
+        return symbol
+
+    async def run(self, stop_event):
+        """持续接收推流直到 stop_event 置位"""
+        import asyncio
+        import random
+        try:
+            import websockets
+        except ImportError:
+            raise RuntimeError("推流模式需要 websockets 库：pip3 install websockets")
+
+        backoff = 1
+        while not stop_event.is_set():
+            try:
+                async with websockets.connect(self.stream_url(), ping_interval=20, close_timeout=5) as ws:
+                    print(f"✓ 已连接推流：{self.stream_url()}")
+                    backoff = 1
+                    async for raw in ws:
+                        symbol = self.handle_message(raw)
+                        if symbol and self.on_tick:
+                            await self.on_tick(symbol)
+                        if stop_event.is_set():
+                            break
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"推流连接中断：{e}")
+
+            if stop_event.is_set():
+                break
+            self.reconnects += 1
+            delay = min(backoff, STREAM_MAX_BACKOFF) * (0.5 + random.random() / 2)
+            print(f"{delay:.1f}s 后重连（第 {self.reconnects} 次）...")
+            try:
+                await asyncio.wait_for(stop_event.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+            backoff = min(backoff * 2, STREAM_MAX_BACKOFF)
+
+
+class StreamMonitor:
+    """
+    推流模式的报告调度：定时推送，或任一交易对相对上次推送的价格
+    变动超过 alert_pct 时立即推送；报告完全由内存行情表生成
+
+    报告与预警在后台任务中生成和发送，不阻塞推流接收；同一时刻最多一份报告在发送
+    （_sending），每条推送先向 RATE_LIMITER 取钉钉的令牌
+    """
+
+    def __init__(self, symbols, url=BINANCE_WS_URL, report_interval=STREAM_REPORT_INTERVAL,
+                 alert_pct=STREAM_ALERT_PCT, sender=None):
+        symbols = [s.upper() for s in symbols]
+        for required in (STREAM_GOLD_SYMBOL, STREAM_BTC_SYMBOL):
+            if required not in symbols:
+                symbols.insert(0, required)
+        self.stream = BinanceTickerStream(symbols, url, on_tick=self.on_tick)
+        self.report_interval = report_interval
+        self.alert_pct = alert_pct
+        self.sender = sender or send_dingtalk_message
+        self.fx_quote = None
+        self.last_report_time = 0
+        self.last_report_prices = {}
+        self.reports_sent = 0
+        self._sending = False
+        self._push_blocked_until = 0
+        self._tasks = set()
+        self.alerts = AlertRuleEngine.from_file()
+
+    def _snapshot(self):
+        """把行情表转换成报告使用的 dict 结构"""
+        ticks = self.stream.ticks
+        gold_tick = ticks.get(STREAM_GOLD_SYMBOL)
+        btc_tick = ticks.get(STREAM_BTC_SYMBOL)
+        if not gold_tick or not btc_tick:
+            return None
+
+        gold = {'price_usd_oz': gold_tick['price'], 'change_pct': gold_tick['change_pct']}
+        silver_tick = ticks.get(STREAM_SILVER_SYMBOL)
+        if silver_tick:
+            silver = {'price_usd_oz': silver_tick['price'], 'change_pct': silver_tick['change_pct']}
+        else:
+            silver = None
+        precious_metals = _fill_metal_fallbacks(gold, silver)
+        bitcoin = {
+            'price_usd': btc_tick['price'],
+            'change_24h_pct': btc_tick['change_pct'],
+            'volume_24h': btc_tick['quote_volume'],
+            'market_cap': 0,
+        }
+        sources = {
+            'gold': f"币安推流 {STREAM_GOLD_SYMBOL}",
+            'silver': f"币安推流 {STREAM_SILVER_SYMBOL}" if silver_tick else "估算 (金银比 85:1)",
+            'bitcoin': f"币安推流 {STREAM_BTC_SYMBOL}",
+            'fx': self.fx_quote['source'] if self.fx_quote else "-",
+        }
+        return precious_metals['gold'], precious_metals['silver'], bitcoin, sources
+
+    def _crossed_threshold(self):
+        """返回相对上次推送变动超过阈值的交易对列表"""
+        crossed = []
+        for symbol, tick in self.stream.ticks.items():
+            last_price = self.last_report_prices.get(symbol)
+            if last_price and abs(tick['price'] / last_price - 1) * 100 >= self.alert_pct:
+                crossed.append(symbol)
+        return crossed
+
+    async def _refresh_fx(self, loop):
+        """汇率走磁盘缓存（过期时后台刷新），在线程池中读取避免阻塞推流"""
+        self.fx_quote = await loop.run_in_executor(None, FX_CACHE.get_quote)
+
+    def _record_tick(self, symbol):
+        """按 STREAM_SAMPLE_INTERVAL 节流，把推流行情写入时间序列"""
+        tick = self.stream.ticks[symbol]
+        asset = STREAM_ASSET_IDS.get(symbol, symbol)
+        ts = int(tick['event_time'] / 1000)
+        last_ts = TICK_STORE.last_timestamp(asset)
+        if last_ts is None or ts - last_ts >= STREAM_SAMPLE_INTERVAL:
+            TICK_STORE.append(asset, tick['price'], tick['change_pct'], ts)
+
+    def _tick_metric_values(self, symbol):
+        """单个交易对更新后需要评估的预警指标"""
+        tick = self.stream.ticks[symbol]
+        asset = STREAM_ASSET_IDS.get(symbol, symbol)
+        values = {(asset, 'price'): tick['price'], (asset, 'change_24h'): tick['change_pct']}
+        past = TICK_STORE.read(asset, time.time() - 3600 - ALERT_CHANGE_1H_TOLERANCE, time.time() - 3600 + 1)
+        if len(past):
+            values[(asset, 'change_1h')] = (tick['price'] / float(past['price'][-1]) - 1) * 100
+        if asset in ('XAU', 'XAG'):
+            gold_tick = self.stream.ticks.get(STREAM_GOLD_SYMBOL)
+            silver_tick = self.stream.ticks.get(STREAM_SILVER_SYMBOL)
+            if gold_tick and silver_tick:
+                values[('XAU/XAG', 'price')] = gold_tick['price'] / silver_tick['price']
+        return values
+
+    def _push(self, title, markdown_text, max_wait=None):
+        """
+        受钉钉频率限制的发送（在线程池中调用）：先取令牌，最多等待 max_wait 秒
+        （默认 RATE_LIMIT_MAX_WAIT），额度不足时抛出 RateLimitExceeded
+        """
+        RATE_LIMITER.acquire(DINGTALK_WEBHOOK, max_wait=max_wait)
+        return self.sender(title, markdown_text)
+
+    def _spawn(self, coroutine):
+        """启动后台任务并保留引用，避免任务在完成前被回收"""
+        import asyncio
+        task = asyncio.get_running_loop().create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def _dispatch_alerts(self, triggered):
+        import asyncio
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, dispatch_alerts, triggered, self._push)
+        except Exception as e:
+            print(f"预警发送失败：{e}")
+        self.alerts.save_state()
+
+    async def on_tick(self, symbol):
+        try:
+            self._record_tick(symbol)
+        except Exception as e:
+            print(f"写入时间序列失败：{e}")
+        if self.alerts.rules:
+            try:
+                triggered = self.alerts.evaluate_many(self._tick_metric_values(symbol))
+                if triggered:
+                    self._spawn(self._dispatch_alerts(triggered))
+            except Exception as e:
+                print(f"预警评估失败：{e}")
+        now = time.time()
+        if self._sending or now < self._push_blocked_until:
+            return
+        crossed = self._crossed_threshold()
+        if not crossed and now - self.last_report_time < self.report_interval:
+            return
+
+        snapshot = self._snapshot()
+        if snapshot is None:
+            return
+
+        self._sending = True
+        self._spawn(self._send_report(snapshot, crossed, now))
+
+    async def _send_report(self, snapshot, crossed, now):
+        """后台生成并发送一份报告；结束时清除 _sending"""
+        import asyncio
+        try:
+            loop = asyncio.get_running_loop()
+            await self._refresh_fx(loop)
+            gold, silver, bitcoin, sources = snapshot
+            sources['fx'] = self.fx_quote['source']
+            signals = await loop.run_in_executor(None, compute_signals)
+            title, markdown_text = build_report_markdown(gold, silver, bitcoin, self.fx_quote['rate'], sources,
+                                                         signals=signals, fx_quote=self.fx_quote)
+            if crossed:
+                moves = "、".join(
+                    f"{s} {self.stream.ticks[s]['price'] / self.last_report_prices[s] - 1:+.2%}" for s in crossed
+                )
+                title = f"⚡ 价格异动：{moves}"
+                markdown_text = f"> ⚡ **价格异动**：{moves}\n\n" + markdown_text
+            extra = self._extra_symbols_markdown()
+            if extra:
+                markdown_text += extra
+
+            result = await loop.run_in_executor(None, self._push, title, markdown_text, 0)
+            if result.get('errcode') == 0:
+                print(f"✅ [{datetime.now().strftime('%H:%M:%S')}] 推送成功：{title}")
+            else:
+                print(f"❌ 推送失败：{result}")
+            self.reports_sent += 1
+            self.last_report_time = now
+            self.last_report_prices = {s: t['price'] for s, t in self.stream.ticks.items()}
+        except RateLimitExceeded as e:
+            print(f"钉钉推送额度不足，{STREAM_PUSH_RETRY}s 后再试：{e}")
+            self._push_blocked_until = time.time() + STREAM_PUSH_RETRY
+        except Exception as e:
+            print(f"推送报告失败：{e}")
+        finally:
+            self._sending = False
+
+    def _extra_symbols_markdown(self):
+        """金银/BTC 之外配置的交易对"""
+        core = {STREAM_GOLD_SYMBOL, STREAM_SILVER_SYMBOL, STREAM_BTC_SYMBOL}
+        rows = [
+            f"| {symbol} | ${tick['price']:,.4f} | {tick['change_pct']:+.2f}% |"
+            for symbol, tick in sorted(self.stream.ticks.items()) if symbol not in core
+        ]
+        if not rows:
+            return ""
+        return "\n### 📋 其他交易对\n| 交易对 | 价格 | 24h 涨跌幅 |\n|------|------|------|\n" + "\n".join(rows) + "\n"
+
+    async def run(self, stop_event=None):
+        import asyncio
+        stop_event = stop_event or asyncio.Event()
+        await self.stream.run(stop_event)
+        if self._tasks:
+            # 等待仍在发送中的报告与预警
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+def run_stream(symbols, url=BINANCE_WS_URL, report_interval=STREAM_REPORT_INTERVAL,
+               alert_pct=STREAM_ALERT_PCT):
+    """启动长期运行的推流模式，Ctrl+C 退出"""
+    import asyncio
+    monitor = StreamMonitor(symbols, url, report_interval, alert_pct)
+    print(f"推流模式启动：{', '.join(monitor.stream.symbols)}"
+          f"（定时 {report_interval}s，异动阈值 {alert_pct}%）")
+    try:
+        asyncio.run(monitor.run())
+    except KeyboardInterrupt:
+        print("\n推流模式已退出")
+
+
+def parse_args(argv=None):
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description='贵金属和加密货币价格监控')
+    parser.add_argument('--no-hedge', action='store_true',
+                        help='关闭对冲请求，备用源仅在主源失败后启动')
+    parser.add_argument('--hedge-delay', type=float, default=None,
+                        help=f'主源超过该秒数未返回即启动备用源（默认取主源 p90 延迟，无记录时 {HEDGE_DELAY}）')
+    parser.add_argument('--sources-status', action='store_true',
+                        help='显示各数据源的延迟、成功率与熔断状态后退出')
+    parser.add_argument('--force', action='store_true',
+                        help='忽略变化抑制，总是推送完整报告')
+    parser.add_argument('--no-charts', action='store_true',
+                        help='报告中不附带走势图')
+    parser.add_argument('--delta-only', action='store_true', default=NOTIFY_DELTA_ONLY,
+                        help='因价格变动触发推送时只发送精简的变动消息')
+    parser.add_argument('--backfill', metavar='SYMBOL',
+                        help='回补币安交易对的历史 K 线（如 PAXGUSDT）后退出')
+    parser.add_argument('--since', metavar='DATE', default=None,
+                        help='回补起始日期 YYYY-MM-DD（UTC，默认一年前；已有数据时从最后一根续传）')
+    parser.add_argument('--interval', default='1m', choices=sorted(KLINE_INTERVAL_MS, key=KLINE_INTERVAL_MS.get),
+                        help='回补 K 线周期（默认 1m）')
+    parser.add_argument('--price-matrix', action='store_true',
+                        help='打印全部金属在各币种、各单位下的价格后退出')
+    parser.add_argument('--watchlist', action='store_true',
+                        help='批量获取配置文件中的自选资产并打印后退出')
+    parser.add_argument('--stream', action='store_true',
+                        help='长期运行，订阅币安 @ticker 推流并定时/异动推送')
+    parser.add_argument('--stream-url', default=BINANCE_WS_URL,
+                        help='推流地址（可指向本地替身服务器）')
+    parser.add_argument('--stream-symbols', default=",".join(STREAM_SYMBOLS),
+                        help='订阅的交易对，逗号分隔')
+    parser.add_argument('--report-interval', type=int, default=STREAM_REPORT_INTERVAL,
+                        help=f'推流模式定时推送间隔秒数（默认 {STREAM_REPORT_INTERVAL}）')
+    parser.add_argument('--alert-pct', type=float, default=STREAM_ALERT_PCT,
+                        help=f'推流模式异动推送阈值百分比（默认 {STREAM_ALERT_PCT}）')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.sources_status:
+        print(SOURCE_HEALTH.format_status())
+        print()
+        print(RATE_LIMITER.format_status())
+        return
+    if args.backfill:
+        if args.since:
+            since = datetime.strptime(args.since, '%Y-%m-%d').replace(tzinfo=timezone.utc)
+        else:
+            since = datetime.now(timezone.utc) - timedelta(days=365)
+        backfill_klines(args.backfill, since, args.interval)
+        try:
+            MarketSketchBook(os.path.join(STATE_DIR, SKETCH_FILE)).update()
+        except Exception as e:
+            print(f"分位数草图更新失败：{e}")
+        return
+    if args.price_matrix:
+        market = acquire_market_data()
+        quote = market['fx_quote']
+        metals = market['precious_metals']
+        prices = {'XAU': metals['gold']['price_usd_oz'], 'XAG': metals['silver']['price_usd_oz']}
+        for record in market['watchlist'].values():
+            if record['kind'] == 'metal':
+                prices.setdefault(record['id'], record['price_usd'])
+        matrix = build_price_matrix(prices, quote['rates'])
+        print(f"汇率：{describe_fx_quote(quote)}")
+        for asset in matrix.assets:
+            print(f"\n{ASSET_NAMES.get(asset, asset)} ({asset})")
+            for currency in matrix.currencies:
+                print("  " + "  ".join(f"{matrix.format(asset, currency, unit):>24}" for unit in matrix.units))
+        FX_CACHE.wait_for_refresh(FX_REFRESH_DEADLINE)
+        return
+    if args.watchlist:
+        for record in fetch_watchlist().values():
+            change = f"{record['change_pct']:+.2f}%" if record.get('change_pct') is not None else "-"
+            print(f"{record['name']:<16}{record['price_usd']:>14,.4f}  {change:>8}  {record['source']}")
+        return
+    if args.stream:
+        symbols = [s.strip() for s in args.stream_symbols.split(",") if s.strip()]
+        run_stream(symbols, args.stream_url, args.report_interval, args.alert_pct)
+        return
+
+    print(f"开始获取实时价格数据... [{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}]")
+
+    # 并发获取数据（黄金/白银、比特币、汇率同时请求）
+    print(f"正在并发获取黄金/白银、比特币价格及汇率（截止 {REPORT_DEADLINE}s）...")
+    market = acquire_market_data(hedge=not args.no_hedge, hedge_delay=args.hedge_delay)
+    precious_metals = market['precious_metals']
+    bitcoin = market['bitcoin']
+    usd_to_cny = market['usd_to_cny']
+
+    # 检查数据获取是否成功
+    if not precious_metals:
+        print("错误：无法获取贵金属价格数据")
+        return
+
+    if not bitcoin:
+        print("错误：无法获取比特币价格数据")
+        return
+
+    gold = precious_metals['gold']
+    silver = precious_metals['silver']
+
+    # 写入时间序列
+    written = record_market_snapshot(market)
+    print(f"已写入 {written} 条时间序列记录")
+
+    # 价格预警
+    try:
+        alert_engine = AlertRuleEngine.from_file()
+        if alert_engine.rules:
+            dispatch_alerts(alert_engine.evaluate_many(collect_metric_values(market)))
+            alert_engine.save_state()
+    except Exception as e:
+        print(f"价格预警处理失败：{e}")
+
+    # 基于历史数据计算技术指标
+    try:
+        signals = compute_signals()
+    except Exception as e:
+        print(f"技术指标计算失败，使用涨跌幅分档点评：{e}")
+        signals = {}
+
+    # 把新的完整交易日并入分位数草图
+    try:
+        sketches = MarketSketchBook(os.path.join(STATE_DIR, SKETCH_FILE)).update()
+    except Exception as e:
+        print(f"分位数草图更新失败：{e}")
+        sketches = None
+
+    # 变化抑制：无明显变动且未到心跳时间时不推送
+    suppressor = ReportSuppressor(os.path.join(STATE_DIR, NOTIFY_STATE_FILE))
+    values = snapshot_values(gold, silver, bitcoin, usd_to_cny)
+    should_send, reason, deltas = suppressor.decide(values)
+    if args.force:
+        should_send, reason = True, "force"
+
+    if not should_send:
+        print(f"价格无明显变动，跳过推送（上次推送：{_format_age(time.time() - suppressor.last['sent_at'])}）")
     else:
-        print(f"❌ 消息发送失败：{result}")
+        if reason == "delta" and args.delta_only:
+            title, markdown_text = build_delta_markdown(deltas, suppressor.last['sent_at'])
+        else:
+            charts = prepare_report_charts() if not args.no_charts else None
+            title, markdown_text = build_report_markdown(gold, silver, bitcoin, usd_to_cny,
+                                                         market['sources'], market['watchlist'], signals,
+                                                         market['fx_quote'], charts, sketches)
+
+        # 发送消息
+        print(f"正在发送钉钉通知（{reason}）...")
+        result = send_dingtalk_message(title, markdown_text)
+
+        if result.get('errcode') == 0:
+            print("✅ 消息发送成功！")
+            suppressor.record(values)
+        else:
+            print(f"❌ 消息发送失败：{result}")
 
     # 打印摘要到控制台
     print("\n" + "="*50)
@@ -409,6 +3228,9 @@ def main():
     print(f"比特币：${bitcoin['price_usd']:,.2f} ({bitcoin['change_24h_pct']:+.2f}%)")
     print("="*50)
 
+    # 等待汇率后台刷新写入缓存
+    FX_CACHE.wait_for_refresh(FX_REFRESH_DEADLINE)
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,26 @@
+"""测试公共夹具：按路径加载文件名含连字符的脚本"""
+import importlib.util
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _load(name, path):
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture(scope="session")
+def monitor():
+    return _load("precious_metals_monitor", os.path.join(ROOT, "precious-metals-monitor.py"))
+
+
+@pytest.fixture(scope="session")
+def ft_digest():
+    sys.path.insert(0, os.path.join(ROOT, "ft-daily-digest"))
+    return _load("ft_digest", os.path.join(ROOT, "ft-daily-digest", "ft_digest.py"))
@@ -0,0 +1,53 @@
+"""ft-daily-digest/ft_digest.py 的回归测试（不访问网络）"""
+import pytest
+
+NEAR_DUPLICATES = [
+    ("Eurozone inflation cools", "Eurozone inflation cools down"),
+    ("Eurozone inflation cools as energy prices fall", "Eurozone inflation cools as energy prices fall — FT"),
+    ("Fed holds rates steady as inflation eases", "Fed holds interest rates steady as inflation eases"),
+    ("China's exports surge in September", "China exports surge in September"),
+    ("Oil prices jump after Opec+ agrees output cut", "Oil prices jump after Opec+ agrees to output cut"),
+    ("Bank of England holds rates at 5.25%", "Bank of England holds interest rates at 5.25%"),
+    ("Live: Stocks rally as US jobs data beats forecasts", "Stocks rally as US jobs data beats forecasts"),
+]
+
+UNRELATED = [
+    "Tesla recalls 2mn cars over autopilot",
+    "Gold hits record high above $4,000",
+    "Japan's yen weakens past 150 per dollar",
+    "Germany enters recession",
+    "Microsoft to invest $10bn in OpenAI",
+    "Evergrande ordered to liquidate",
+    "US Treasury yields climb to 16-year high",
+    "Bitcoin tops $100,000",
+]
+
+
+def _article(title, index, feed):
+    return {"title": title, "summary": "", "url": f"https://www.ft.com/content/{index}", "feeds": [feed]}
+
+
+@pytest.mark.parametrize("first, second", NEAR_DUPLICATES)
+def test_headline_variants_are_merged(ft_digest, first, second):
+    merged = ft_digest.dedupe_articles([_article(first, 1, "市场"), _article(second, 2, "全球")])
+    assert len(merged) == 1
+    assert merged[0]["title"] == first
+    assert merged[0]["feeds"] == ["市场", "全球"]
+
+
+def test_unrelated_headlines_are_kept(ft_digest):
+    articles = [_article(title, i, "全球") for i, title in enumerate(UNRELATED)]
+    assert len(ft_digest.dedupe_articles(articles)) == len(UNRELATED)
+
+
+def test_bands_cover_every_bit_within_threshold(ft_digest, monkeypatch):
+    # 距离恰为阈值、且差异位落在各段边界上的指纹也必须进同一桶
+    base = ft_digest.simhash("Eurozone inflation cools")
+    flipped = base
+    for bit in range(0, 64, 64 // ft_digest.SIMHASH_MAX_DISTANCE)[:ft_digest.SIMHASH_MAX_DISTANCE]:
+        flipped ^= 1 << bit
+    assert (base ^ flipped).bit_count() == ft_digest.SIMHASH_MAX_DISTANCE
+    fingerprints = {"a": base, "b": flipped}
+    monkeypatch.setattr(ft_digest, "simhash", lambda text: fingerprints[text.split()[0]])
+    merged = ft_digest.dedupe_articles([_article("a", 1, "x"), _article("b", 2, "y")])
+    assert len(merged) == 1
@@ -0,0 +1,114 @@
+"""precious-metals-monitor.py 的回归测试（不访问网络）"""
+import json
+import os
+import time
+
+import numpy as np
+
+
+def _kline_rows(start_ms, count, step_ms, price=2000.0):
+    return [[start_ms + i * step_ms, price, price, price, price + i * 0.01, 1.0] for i in range(count)]
+
+
+def test_klines_crossing_end_day_stay_inside_price_matrix(monitor, tmp_path):
+    store = monitor.TickStore(str(tmp_path / "ticks"))
+    kline_store = monitor.KlineStore(str(tmp_path / "klines"))
+    today = 20000
+    now = today * 86400 + 12 * 3600
+    # 1h K 线一直延续到今天中午，最后一根跨日的 K 线收盘于今天 0 点
+    step = monitor.KLINE_INTERVAL_MS['1h']
+    first_ms = (today - 40) * 86400 * 1000
+    kline_store.append('PAXGUSDT', '1h', _kline_rows(first_ms, (now * 1000 - first_ms) // step, step))
+    store.append_many('XAG', [(today - 40 + i) * 86400 + 3600 for i in range(41)], [25.0 + i * 0.1 for i in range(41)])
+
+    end = today * 86400 - 1
+    ts, _ = monitor.load_asset_history('XAU', (today - 40) * 86400, end, store, kline_store)
+    assert ts.max() <= end
+
+    book = monitor.MarketSketchBook(str(tmp_path / "sketches.json")).update(now, store, kline_store)
+    assert book.digest('return:XAU').count > 0
+    assert book.entries['return:XAU']['last_day'] == today - 1
+
+
+def test_open_circuit_removes_single_source_chain(monitor, tmp_path, monkeypatch):
+    registry = monitor.SourceHealthRegistry(str(tmp_path / "health.json"))
+    monkeypatch.setattr(monitor, 'SOURCE_HEALTH', registry)
+    sources = [("币安 PAXG/USDT", "https://api.binance.com/api/v3/ticker/24hr?symbol=PAXGUSDT", None)]
+    for _ in range(monitor.CIRCUIT_FAILURE_THRESHOLD):
+        registry.record(sources[0][1], False, 0.1, "500")
+
+    assert registry.rank(sources) == []
+    calls = []
+    monkeypatch.setattr(monitor, '_fetch_one_source', lambda *args, **kwargs: calls.append(args))
+    assert monitor.fetch_from_sources(sources, "黄金") == (None, None)
+    assert calls == []
+
+    # 熔断到期后只放行一次试探
+    stats = registry.endpoints[monitor._endpoint_key(sources[0][1])]
+    stats['circuit_open_until'] = 1
+    assert registry.rank(sources) == sources
+    assert registry.rank(sources) == []
+    registry.record(sources[0][1], True, 0.1)
+    assert registry.rank(sources) == sources
+
+
+def test_alert_rules_fire_once_and_rearm_after_hysteresis(monitor, tmp_path):
+    rules = [
+        {'id': 'gold-high', 'asset': 'XAU', 'op': '>', 'value': 2100, 'cooldown': 0, 'hysteresis_pct': 1},
+        {'id': 'gold-low', 'asset': 'XAU', 'op': '<', 'value': 1900, 'cooldown': 0},
+    ]
+    engine = monitor.AlertRuleEngine(rules, str(tmp_path / "alert-state.json"))
+    assert engine.index[('XAU', 'price')]['up']['fire_keys'] == [2100.0]
+
+    assert engine.evaluate('XAU', 'price', 2000, now=1) == []
+    assert [r['id'] for r in engine.evaluate('XAU', 'price', 2150, now=2)] == ['gold-high']
+    assert engine.evaluate('XAU', 'price', 2090, now=3) == []  # 未跌破 2079 的重新武装水位
+    assert engine.evaluate('XAU', 'price', 2120, now=4) == []
+    assert engine.evaluate('XAU', 'price', 2070, now=5) == []
+    assert [r['id'] for r in engine.evaluate('XAU', 'price', 2101, now=6)] == ['gold-high']
+    assert [r['id'] for r in engine.evaluate('XAU', 'price', 1850, now=7)] == ['gold-low']
+
+
+def test_stream_reports_run_in_background_and_respect_push_limit(monitor, tmp_path, monkeypatch):
+    import asyncio
+    import threading
+
+    monkeypatch.setattr(monitor, 'TICK_STORE', monitor.TickStore(str(tmp_path / "ticks")))
+    monkeypatch.setattr(monitor, 'ALERT_RULES_FILE', str(tmp_path / "no-rules.json"))
+    monkeypatch.setattr(monitor, 'RATE_LIMITER', monitor.ProviderRateLimiter(
+        str(tmp_path / "limits.sqlite"), {'oapi.dingtalk.com': {'per_minute': 2, 'per_month': None}}))
+    fx = monitor.FxRateCache(str(tmp_path / "fx-cache.json"))
+    monkeypatch.setattr(fx, 'get_quote', lambda *args: fx._quote(
+        {'rates': {'CNY': 7.2}, 'source': "测试", 'fetched_at': time.time()}, False))
+    monkeypatch.setattr(monitor, 'FX_CACHE', fx)
+    monkeypatch.setattr(monitor, 'compute_signals', lambda *args, **kwargs: {})
+
+    release = threading.Event()
+    sent = []
+
+    def slow_sender(title, text):
+        release.wait(5)
+        sent.append(title)
+        return {'errcode': 0}
+
+    stream = monitor.StreamMonitor(["PAXGUSDT", "BTCUSDT"], report_interval=0, alert_pct=100, sender=slow_sender)
+
+    async def scenario():
+        for i, symbol in enumerate(["PAXGUSDT", "BTCUSDT"]):
+            stream.stream.handle_message(json.dumps({'s': symbol, 'c': str(2000 + i), 'E': 1_700_000_000_000}))
+        started = time.monotonic()
+        for _ in range(20):
+            await stream.on_tick("PAXGUSDT")
+        # 报告在后台发送，推流处理不等待；发送中的报告挡住后续报告
+        assert time.monotonic() - started < 1
+        assert stream._sending and len(stream._tasks) == 1
+        release.set()
+        await asyncio.gather(*stream._tasks)
+        for _ in range(5):
+            await stream.on_tick("PAXGUSDT")
+            await asyncio.gather(*stream._tasks)
+
+    asyncio.run(scenario())
+    # 每分钟额度 2 条：第三份报告被限流拒绝
+    assert len(sent) == 2
+    assert stream._push_blocked_until > 0